@@ -0,0 +1,130 @@
+import random
+import time
+import numpy as np
+from engine import EMPTY_CELL, STONE_CELL, BOMB_CELL
+
+# --- 定数定義 ---
+WIN_SCORE = 10000.0
+DICE_FACES = (1, 2, 3)
+DEFAULT_TIME_BUDGET = 0.08
+DEFAULT_TABLE_SIZE = 200000
+POINT_KEY_RANGE = 1024
+
+class SearchTimeout(Exception):
+    pass
+
+# --- Zobrist ハッシュ ---
+# 盤面・両プレイヤーの座標と得点・手番を 64bit キーの XOR で表す
+class ZobristHasher:
+    def __init__(self, size, seed=0x5EED):
+        rng = np.random.default_rng(seed)
+        self.size = size
+        self.cell_keys = rng.integers(1, 2**63, size=(size * size, 8), dtype=np.uint64)
+        self.cell_keys[:, EMPTY_CELL] = 0
+        self.cell_index = np.arange(size * size)
+        self.pos_keys = {p: rng.integers(1, 2**63, size=size * size).tolist() for p in (1, 2)}
+        self.point_keys = {p: rng.integers(1, 2**63, size=POINT_KEY_RANGE).tolist() for p in (1, 2)}
+        self.turn_key = int(rng.integers(1, 2**63))
+
+    def hash(self, state):
+        key = int(np.bitwise_xor.reduce(self.cell_keys[self.cell_index, state.board.ravel()]))
+        for p in (1, 2):
+            r, c = state.player_pos[p]
+            key ^= self.pos_keys[p][r * self.size + c] ^ self.point_keys[p][state.player_points[p] % POINT_KEY_RANGE]
+        if state.current_turn_player == 2: key ^= self.turn_key
+        return key
+
+# --- 探索対象の手 ---
+# 他に手があるときの自発的な落下は必ず負けなので探索から外す
+def search_turns(state, dice=None):
+    turns = list(state.iter_turns(dice))
+    return [turn for turn in turns if turn[1] != 'fall'] or turns[:1]
+
+# --- 評価関数 ---
+def _mobility(state, player):
+    r, c = state.player_pos[player]
+    other_pos, board = state.player_pos[3 - player], state.board
+    return sum(1 for n in state.tables.neighbors[r * state.size + c]
+               if n != other_pos and board[n] != STONE_CELL and board[n] != BOMB_CELL)
+
+def evaluate(state, player):
+    opponent = 3 - player
+    return 10.0 * (_mobility(state, player) - _mobility(state, opponent)) + \
+        0.1 * (state.player_points[player] - state.player_points[opponent])
+
+# --- 単純な方策 ---
+# 自己対戦や大会の相手用。どちらも探索せずに1ターン分の行動を返す
+class RandomAI:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def choose_turn(self, state):
+        turns = search_turns(state)
+        return self.rng.choice(turns) if turns else None
+
+# 1手先だけを読み、評価値が最も高いターンを選ぶ
+class GreedyAI:
+    def choose_turn(self, state):
+        turns = search_turns(state)
+        if len(turns) <= 1: return turns[0] if turns else None
+        player, root = state.current_turn_player, state.copy()
+        def value(turn):
+            root.push_undo(); root.play_turn(turn)
+            score = evaluate(root, player) if root.winner is None else WIN_SCORE if root.winner == player else -WIN_SCORE
+            root.undo()
+            return score
+        return max(turns, key=value)
+
+# --- Expectimax 探索 ---
+# 手番側の最大化とダイス (1〜3 の等確率) の期待値を交互に取り、制限時間まで反復深化する
+class ExpectimaxAI:
+    def __init__(self, time_budget=DEFAULT_TIME_BUDGET, max_depth=6, table_size=DEFAULT_TABLE_SIZE):
+        self.time_budget, self.max_depth, self.table_size = time_budget, max_depth, table_size
+        self.table, self.hasher = {}, None
+        self.deadline, self.depth_reached, self.nodes = 0.0, 0, 0
+
+    # 制限時間は呼ばれた時点から数える (ハッシュ表の準備や合法手の列挙も含める)
+    def choose_turn(self, state):
+        self.deadline, self.depth_reached, self.nodes = time.perf_counter() + self.time_budget, 0, 0
+        turns = search_turns(state)
+        if len(turns) <= 1: return turns[0] if turns else None
+        if self.hasher is None or self.hasher.size != state.size: self.hasher, self.table = ZobristHasher(state.size), {}
+        player = state.current_turn_player
+        best = turns[0]
+        for depth in range(1, self.max_depth + 1):
+            # 探索は作業用コピー上で push_undo/undo により進める (時間切れ時はコピーごと捨てる)
+            root = state.copy()
+            try:
+                values = {turn: self._turn_value(root, turn, player, depth) for turn in turns}
+            except SearchTimeout:
+                break
+            turns.sort(key=values.get, reverse=True)
+            best, self.depth_reached = turns[0], depth
+            if abs(values[best]) >= WIN_SCORE: break
+        return best
+
+    # 時間切れは手を指す前に確かめる (深さ1の葉の並びの途中でも打ち切れるように)
+    def _turn_value(self, state, turn, player, depth):
+        if time.perf_counter() > self.deadline: raise SearchTimeout()
+        state.push_undo(); state.play_turn(turn)
+        if state.winner is not None: value = WIN_SCORE if state.winner == player else -WIN_SCORE
+        elif depth <= 1: value = evaluate(state, player)
+        else: value = -self._chance_value(state, depth - 1)
+        state.undo()
+        return value
+
+    def _chance_value(self, state, depth):
+        key = self.hasher.hash(state)
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth: return entry[1]
+        if time.perf_counter() > self.deadline: raise SearchTimeout()
+        self.nodes += 1
+        player, total = state.current_turn_player, 0.0
+        for dice in DICE_FACES:
+            turns = search_turns(state, dice)
+            if not turns: total -= WIN_SCORE
+            else: total += max(self._turn_value(state, turn, player, depth) for turn in turns)
+        value = total / len(DICE_FACES)
+        if len(self.table) >= self.table_size: del self.table[next(iter(self.table))]
+        self.table[key] = (depth, value)
+        return value
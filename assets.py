@@ -0,0 +1,147 @@
+import argparse
+import hashlib
+import os
+import struct
+import time
+import pygame
+
+# --- 定数定義 ---
+ICON_NAMES = ('stone', 'recovery', 'bomb', 'ice')
+DEFAULT_ICON_SIZE = 64
+DEFAULT_ATLAS_NAME = "icon_atlas.cache"
+# アトラスファイル: ヘッダ (マジック, 版, アイコンの大きさ, アイコン数, 元画像のキー) + 横一列に並べた RGBA の生バイト列
+# 生バイト列なので読み込みに画像のデコードも縮小も要らない。キーが元画像と合わなければ作り直す
+ATLAS_MAGIC = b"ICAT"
+ATLAS_VERSION = 1
+ATLAS_HEADER = struct.Struct("<4sBHB20s")
+# 代用アイコンの色
+PLACEHOLDER_COLORS = {'stone': (128, 128, 128), 'recovery': (20, 120, 110), 'bomb': (40, 40, 40), 'ice': (235, 250, 255)}
+
+# --- 代用アイコン ---
+# 画像ファイルが無い・壊れているときに使う。ファイルを一切読まない環境 (ヘッドレスのツールやベンチマーク) でも同じ
+def draw_placeholder_icon(name, size):
+    surface = pygame.Surface((size, size), pygame.SRCALPHA)
+    color, center, radius = PLACEHOLDER_COLORS.get(name, (255, 0, 255)), (size // 2, size // 2), size * 3 // 8
+    if name == 'stone':
+        pygame.draw.circle(surface, color, center, radius)
+        pygame.draw.circle(surface, (80, 80, 80), center, radius, max(1, size // 16))
+    elif name == 'recovery':
+        bar = max(1, size // 5)
+        pygame.draw.rect(surface, color, (center[0] - bar // 2, center[1] - radius, bar, radius * 2))
+        pygame.draw.rect(surface, color, (center[0] - radius, center[1] - bar // 2, radius * 2, bar))
+    elif name == 'bomb':
+        pygame.draw.circle(surface, color, (center[0], center[1] + size // 16), radius)
+        pygame.draw.line(surface, (255, 200, 0), (center[0] + radius // 2, center[1] - radius // 2),
+                         (center[0] + radius, center[1] - radius), max(1, size // 16))
+    else:
+        points = [(center[0], center[1] - radius), (center[0] + radius, center[1]), (center[0], center[1] + radius),
+                  (center[0] - radius, center[1])]
+        pygame.draw.polygon(surface, color, points)
+        pygame.draw.polygon(surface, (120, 170, 200), points, max(1, size // 16))
+    return surface
+
+# --- アトラスの作成と読み込み ---
+# 元画像のキー: 各ファイルの中身の SHA-1 (無ければ "missing") とアイコンの大きさ・形式の版から作る
+def source_key(paths, icon_size):
+    digest = hashlib.sha1(struct.pack("<BH", ATLAS_VERSION, icon_size))
+    for name, path in paths.items():
+        digest.update(name.encode())
+        try:
+            with open(path, 'rb') as f: digest.update(hashlib.sha1(f.read()).digest())
+        except OSError:
+            digest.update(b"missing")
+    return digest.digest()
+
+def build_atlas(paths, icon_size):
+    atlas = pygame.Surface((icon_size * len(paths), icon_size), pygame.SRCALPHA)
+    for index, (name, path) in enumerate(paths.items()):
+        try:
+            icon = pygame.transform.scale(pygame.image.load(path), (icon_size, icon_size))
+        except (OSError, pygame.error):
+            icon = draw_placeholder_icon(name, icon_size)
+        _copy_icon(atlas, icon, index * icon_size)
+    return atlas
+
+# 透明部分を含むアイコンを普通に blit すると透明なアトラスとの合成で色が変わるので、ゼロへの加算でそのまま写す
+def _copy_icon(atlas, icon, x):
+    atlas.blit(icon, (x, 0), special_flags=pygame.BLEND_RGBA_ADD if icon.get_flags() & pygame.SRCALPHA else 0)
+
+def save_atlas(path, atlas, icon_size, key):
+    data = ATLAS_HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, icon_size, atlas.get_width() // icon_size, key)
+    with open(path + ".tmp", 'wb') as f: f.write(data + pygame.image.tobytes(atlas, 'RGBA'))
+    os.replace(path + ".tmp", path)
+
+# キーと大きさが合うアトラスがあればその Surface を、無ければ None を返す
+def load_atlas(path, icon_size, count, key):
+    try:
+        with open(path, 'rb') as f: data = f.read()
+    except OSError:
+        return None
+    if len(data) < ATLAS_HEADER.size: return None
+    magic, version, stored_size, stored_count, stored_key = ATLAS_HEADER.unpack_from(data)
+    if (magic, version, stored_size, stored_count, stored_key) != (ATLAS_MAGIC, ATLAS_VERSION, icon_size, count, key):
+        return None
+    pixels = data[ATLAS_HEADER.size:]
+    if len(pixels) != icon_size * count * icon_size * 4: return None
+    return pygame.image.frombytes(pixels, (icon_size * count, icon_size), 'RGBA')
+
+# --- アイコンアトラス ---
+# 作るだけではファイルに触れず、最初に icons() を呼んだときにアトラスを読み込む (無ければ作って保存する)
+# directory が None なら画像ファイルもキャッシュも使わず代用アイコンだけで作る
+class IconAtlas:
+    def __init__(self, directory='.', icon_size=DEFAULT_ICON_SIZE, cache_path=None, names=ICON_NAMES):
+        self.directory, self.icon_size, self.names = directory, icon_size, tuple(names)
+        self.cache_path = cache_path or (os.path.join(directory, DEFAULT_ATLAS_NAME) if directory is not None else None)
+        self.surface, self._icons = None, None
+
+    def source_paths(self):
+        return {name: os.path.join(self.directory, f"{name}.png") for name in self.names}
+
+    def load(self):
+        if self.surface is not None: return self.surface
+        if self.directory is None:
+            atlas = pygame.Surface((self.icon_size * len(self.names), self.icon_size), pygame.SRCALPHA)
+            for index, name in enumerate(self.names):
+                _copy_icon(atlas, draw_placeholder_icon(name, self.icon_size), index * self.icon_size)
+        else:
+            paths = self.source_paths()
+            key = source_key(paths, self.icon_size)
+            atlas = load_atlas(self.cache_path, self.icon_size, len(self.names), key)
+            if atlas is None:
+                atlas = build_atlas(paths, self.icon_size)
+                try:
+                    save_atlas(self.cache_path, atlas, self.icon_size, key)
+                except OSError:
+                    pass
+        self.surface = atlas.convert_alpha() if pygame.display.get_surface() else atlas
+        return self.surface
+
+    def icon_rect(self, name):
+        return pygame.Rect(self.names.index(name) * self.icon_size, 0, self.icon_size, self.icon_size)
+
+    # アイコン名 → アトラスのサブサーフェス (ピクセルはアトラスと共有する)
+    def icons(self):
+        if self._icons is None:
+            atlas = self.load()
+            self._icons = {name: atlas.subsurface(self.icon_rect(name)) for name in self.names}
+        return self._icons
+
+# --- コマンドライン ---
+# キオスクなどで起動前にアトラスを作っておくためのもの
+def main():
+    parser = argparse.ArgumentParser(description="アイコン画像を縮小済みのアトラスファイルにまとめる")
+    parser.add_argument('--directory', default='.', help="stone.png などの元画像があるディレクトリ")
+    parser.add_argument('--output', default=None, help=f"アトラスファイル (既定は DIRECTORY/{DEFAULT_ATLAS_NAME})")
+    parser.add_argument('--icon-size', type=int, default=DEFAULT_ICON_SIZE)
+    args = parser.parse_args()
+    atlas = IconAtlas(args.directory, args.icon_size, args.output)
+    paths = atlas.source_paths()
+    missing = [name for name, path in paths.items() if not os.path.exists(path)]
+    start = time.perf_counter()
+    key = source_key(paths, atlas.icon_size)
+    save_atlas(atlas.cache_path, build_atlas(paths, atlas.icon_size), atlas.icon_size, key)
+    print(f"{atlas.cache_path}: {len(paths)} icons at {atlas.icon_size}px ({time.perf_counter() - start:.3f}s)")
+    if missing: print(f"placeholders: {', '.join(missing)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+from engine import GameState, DEFAULT_SKILL_COSTS, EMPTY_CELL, STONE_CELL, ICE_CELL
+from ai import RandomAI
+from tournament import play_game, MAX_TURNS
+
+# --- 定数定義 ---
+BENCH_FORMAT = 1
+DEFAULT_REPEAT = 7
+DEFAULT_MIN_TIME = 0.2
+DEFAULT_THRESHOLD = 0.10
+BENCH_SEED = 12345
+
+# --- ベンチマークの登録 ---
+# 各ベンチマークは準備をして (計測する関数, 1回の呼び出しに含まれる操作数) を返す
+# 盤面や局面は固定のシードから作るので、同じ版なら毎回同じ処理を計測する
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def _started_state(size, seed=BENCH_SEED):
+    state = GameState(size, seed=seed)
+    for player_num in (1, 2): state.select_starting_skill(player_num, 'ice_skill')
+    return state
+
+# 空きマスの一部を cell で埋める (プレイヤーのいるマスには置かない)
+def _scatter(state, cell, density, rng):
+    occupied = set(state.player_pos.values())
+    for r, c in np.argwhere(state.board == EMPTY_CELL).tolist():
+        if (r, c) not in occupied and rng.random() < density: state._set_cell(r, c, cell)
+
+# 氷の多い盤で、ダイス 1〜3 の移動先を求める (氷を滑るぶん光線を長く辿る)
+def _movable_ice(size):
+    state, rng = _started_state(size), random.Random(BENCH_SEED)
+    _scatter(state, ICE_CELL, 0.6, rng)
+    _scatter(state, STONE_CELL, 0.05, rng)
+    state.current_phase = "move"
+    def run():
+        for dice in (1, 2, 3):
+            state.dice_roll = dice; state.find_movable_tiles()
+    run()
+    if state.winner is not None: raise RuntimeError("benchmark board leaves the player blocked")
+    return run, 3
+
+# 石の多い盤の全ての石について図形ボーナスを判定する
+def _figure_bonus(size):
+    state, rng = _started_state(size), random.Random(BENCH_SEED)
+    _scatter(state, STONE_CELL, 0.35, rng)
+    stones = [tuple(pos) for pos in np.argwhere(state.board == STONE_CELL).tolist()]
+    def run():
+        for r, c in stones: state.check_figure_bonus(r, c)
+    return run, len(stones)
+
+# 盤上の色々な位置・配置種別で置ける場所を求める (置ける場所が必ずある位置だけを使う)
+def _placeable(size):
+    state, rng = _started_state(size), random.Random(BENCH_SEED)
+    _scatter(state, STONE_CELL, 0.3, rng)
+    _scatter(state, ICE_CELL, 0.1, rng)
+    state.current_phase = "place"
+    cases = []
+    for r, c in np.argwhere(state.board == EMPTY_CELL).tolist()[::3]:
+        for p_type in ('stone', 'recovery', 'ice'):
+            state.player_pos[state.current_turn_player] = (r, c)
+            if state._placement_targets((r, c), p_type): cases.append(((r, c), p_type))
+    player = state.current_turn_player
+    def run():
+        for pos, p_type in cases:
+            state.player_pos[player], state.placement_type = pos, p_type
+            state.find_placeable_tiles()
+    return run, len(cases)
+
+for _size in (9, 33, 101):
+    benchmark(f"engine.find_movable_tiles.ice.{_size}")(lambda size=_size: _movable_ice(size))
+    benchmark(f"engine.check_figure_bonus.{_size}")(lambda size=_size: _figure_bonus(size))
+    benchmark(f"engine.find_placeable_tiles.{_size}")(lambda size=_size: _placeable(size))
+
+# ランダム方策どうしの対局を最後まで進める。操作数はターン数 (1局ごとのシードは呼び出し回数で変える)
+@benchmark("game.random_selfplay.9")
+def _selfplay():
+    policies, counter = {1: RandomAI(), 2: RandomAI()}, [0]
+    def run():
+        counter[0] += 1
+        seed = BENCH_SEED + counter[0]
+        policies[1].rng.seed(seed); policies[2].rng.seed(seed + 1)
+        state = play_game(policies, seed, DEFAULT_SKILL_COSTS, (True, True))[0]
+        return state.turn_number
+    return run, None
+
+# --- 描画 ---
+# SDL のダミードライバで画面を作り、オフスクリーンのサーフェスへ描く。アイコンは画像ファイルを読まない代用アイコン
+_display = {}
+
+def _display_setup():
+    if not _display:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy"); os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+        os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+        import pygame
+        import main as ui
+        from assets import IconAtlas
+        pygame.init(); pygame.display.set_mode((ui.SCREEN_WIDTH, ui.SCREEN_HEIGHT))
+        fonts = {'small': pygame.font.Font(None, 32), 'medium': pygame.font.Font(None, 40), 'large': pygame.font.Font(None, 50)}
+        _display.update(pygame=pygame, ui=ui, icons=ui.IconCache(IconAtlas(None, int(ui.CELL_SIZE * 0.8))), fonts=fonts,
+                        buttons=ui.make_button_rects(), surface=pygame.Surface((ui.SCREEN_WIDTH, ui.SCREEN_HEIGHT)))
+    return _display
+
+# 途中まで進めた局面 (移動先のハイライトあり) を用意する
+def _midgame_state(size, turns=20):
+    state, rng = _started_state(size), random.Random(BENCH_SEED)
+    for _ in range(turns):
+        state.roll_dice()
+        if state.winner is not None: break
+        state.play_turn(rng.choice(list(state.iter_turns())))
+        if state.winner is not None: break
+    if state.winner is None: state.roll_dice()
+    return state
+
+@benchmark("render.draw_board.9")
+def _draw_board():
+    d = _display_setup()
+    state, camera = _midgame_state(9), d['ui'].Camera(9)
+    return lambda: d['ui'].draw_board(d['surface'], state, d['icons'], camera), 1
+
+@benchmark("render.draw_board.101")
+def _draw_board_large():
+    d = _display_setup()
+    state, camera = _midgame_state(101), d['ui'].Camera(101)
+    return lambda: d['ui'].draw_board(d['surface'], state, d['icons'], camera), 1
+
+# パネルは RenderCache が温まった状態 (通常のフレーム) と、毎回空のキャッシュ (表示内容が変わったフレーム) の両方
+@benchmark("render.draw_player_panels.cached")
+def _draw_panels():
+    d = _display_setup()
+    state, cache = _midgame_state(9), d['ui'].RenderCache()
+    return lambda: d['ui'].draw_player_panels(d['surface'], state, d['fonts'], d['buttons'], cache=cache), 1
+
+@benchmark("render.draw_player_panels.uncached")
+def _draw_panels_uncached():
+    d = _display_setup()
+    state, ui = _midgame_state(9), d['ui']
+    return lambda: ui.draw_player_panels(d['surface'], state, d['fonts'], d['buttons'], cache=ui.RenderCache()), 1
+
+# 差分描画: 変化のないフレームと、全体を描き直すフレーム
+@benchmark("render.frame.idle")
+def _frame_idle():
+    d = _display_setup()
+    state, renderer = _midgame_state(9), d['ui'].FrameRenderer(d['icons'])
+    renderer.render(d['surface'], state, d['fonts'], d['buttons'])
+    return lambda: renderer.render(d['surface'], state, d['fonts'], d['buttons']), 1
+
+@benchmark("render.frame.full")
+def _frame_full():
+    d = _display_setup()
+    state, renderer = _midgame_state(9), d['ui'].FrameRenderer(d['icons'])
+    def run():
+        renderer.invalidate(); renderer.render(d['surface'], state, d['fonts'], d['buttons'])
+    return run, 1
+
+# --- 計測 ---
+# 1回の計測が min_time 秒以上になるよう呼び出し回数を決め、repeat 回計測する
+# 操作数が None のベンチマークは、呼び出しの戻り値を操作数として数える
+def measure(name, repeat=DEFAULT_REPEAT, min_time=DEFAULT_MIN_TIME):
+    run, ops = BENCHMARKS[name]()
+    run()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number): run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 4 or number >= 1 << 20: break
+        number *= 2
+    number = max(1, round(number * min_time / max(elapsed, 1e-9)))
+    samples = []
+    for _ in range(repeat):
+        done, start = 0, time.perf_counter()
+        for _ in range(number):
+            result = run()
+            done += result if ops is None else ops
+        samples.append((time.perf_counter() - start) / max(done, 1))
+    samples = np.array(samples) * 1e9
+    return {'ops_per_sample': done, 'calls': number, 'repeat': repeat, 'min_ns': float(samples.min()),
+            'median_ns': float(np.median(samples)), 'mean_ns': float(samples.mean()), 'stdev_ns': float(samples.std()),
+            'ops_per_sec': float(1e9 / np.median(samples))}
+
+# pygame は読み込み時に標準出力へ挨拶を出し、標準出力の JSON を壊すので止めておく
+def environment():
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'numpy': np.__version__, 'pygame': pygame.version.ver, 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpu_count': os.cpu_count()}
+
+def run_benchmarks(patterns=None, repeat=DEFAULT_REPEAT, min_time=DEFAULT_MIN_TIME, progress=None):
+    names = [name for name in BENCHMARKS if not patterns or any(fnmatch.fnmatch(name, p) for p in patterns)]
+    results = {}
+    for name in names:
+        results[name] = measure(name, repeat, min_time)
+        if progress: progress(name, results[name])
+    return {'format': BENCH_FORMAT, 'seed': BENCH_SEED, 'max_turns': MAX_TURNS, 'environment': environment(),
+            'results': results}
+
+# 基準の結果と比べ、中央値が threshold (比率) を超えて遅くなったものを (名前, 基準, 今回, 比) で返す
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None: continue
+        ratio = result['median_ns'] / base['median_ns']
+        if ratio > 1 + threshold: regressions.append((name, base['median_ns'], result['median_ns'], ratio))
+    return regressions
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="エンジン・自己対戦・描画のベンチマーク (結果は JSON)")
+    parser.add_argument('patterns', nargs='*', help="実行するベンチマーク名のパターン (fnmatch 形式、省略時は全部)")
+    parser.add_argument('--list', action='store_true', help="ベンチマーク名の一覧を表示する")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME, help="1回の計測の目安の秒数")
+    parser.add_argument('--output', default=None, help="結果を書き出す JSON ファイル (省略時は標準出力)")
+    parser.add_argument('--compare', default=None, help="基準の結果 JSON。遅くなったベンチマークがあれば終了コード 1")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="遅くなったとみなす中央値の増加率")
+    args = parser.parse_args()
+    if args.list:
+        for name in BENCHMARKS: print(name)
+        return 0
+    def progress(name, result):
+        print(f"{name:40s} {result['median_ns'] / 1000:12.2f} us/op  (±{result['stdev_ns'] / 1000:.2f})", file=sys.stderr)
+    current = run_benchmarks(args.patterns, args.repeat, args.min_time, progress)
+    if args.output:
+        with open(args.output, 'w') as f: json.dump(current, f, indent=2, sort_keys=True)
+    else:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True); print()
+    if not args.compare: return 0
+    with open(args.compare) as f: baseline = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for name, base, now, ratio in regressions:
+        print(f"regression: {name} {base / 1000:.2f} -> {now / 1000:.2f} us/op (x{ratio:.2f})", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import pygame
+import sys
+import argparse
+import json
+import socket
+import threading
+import time
+from engine import GameState, FIGURE_BONUS_DURATION
+from server import apply_state_message
+from main import (SCREEN_WIDTH, SCREEN_HEIGHT, DEFAULT_MAX_FPS, FrameRenderer, load_icon_images, make_button_rects,
+                  click_to_action, advance_figure_bonus, next_figure_bonus_change, wait_for_events)
+
+# サーバーからの1行を pygame のイベントとしてメインスレッドに渡す
+SERVER_MESSAGE_EVENT = pygame.USEREVENT + 1
+
+def read_server_messages(sock_file):
+    for line in sock_file:
+        pygame.event.post(pygame.event.Event(SERVER_MESSAGE_EVENT, message=json.loads(line)))
+    pygame.event.post(pygame.event.Event(SERVER_MESSAGE_EVENT, message={'t': 'closed'}))
+
+def send_message(sock, message):
+    sock.sendall(json.dumps(message, separators=(',', ':')).encode() + b"\n")
+
+# --- メイン処理 ---
+# 盤面は受け取った状態を写すだけで、ルールの判定やダイスはすべてサーバーが行う
+def main(host, port, match_id=None, max_fps=DEFAULT_MAX_FPS):
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("2人対戦ターン制ストラテジーゲーム (オンライン)")
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+
+    fonts = { 'small': pygame.font.Font(None, 32), 'medium': pygame.font.Font(None, 40), 'large': pygame.font.Font(None, 50) }
+
+    icon_images = load_icon_images()
+    game_state = GameState()
+    button_rects = make_button_rects()
+    frame_renderer = FrameRenderer(icon_images)
+
+    sock = socket.create_connection((host, port))
+    threading.Thread(target=read_server_messages, args=(sock.makefile('r', encoding='utf-8'),), daemon=True).start()
+    send_message(sock, {'op': 'join', 'match': match_id})
+    seat = None
+
+    frame_interval = 1.0 / max_fps
+    last_time, next_frame_time = time.monotonic(), 0.0
+    events = []
+    while True:
+        now = time.monotonic()
+        advance_figure_bonus(game_state, now - last_time); last_time = now
+
+        for event in events:
+            if event.type == pygame.QUIT:
+                sock.close(); pygame.quit(); sys.exit()
+
+            if event.type == SERVER_MESSAGE_EVENT:
+                message = event.message
+                if message['t'] == 'joined':
+                    seat = message['seat']
+                    pygame.display.set_caption(f"2人対戦ターン制ストラテジーゲーム (オンライン: 対戦 {message['match']} / P{seat})")
+                elif message['t'] == 'state':
+                    apply_state_message(game_state, message)
+                    if message.get('figure_bonus_tiles'): game_state.figure_bonus_timer = FIGURE_BONUS_DURATION
+                    if message.get('full'): frame_renderer.invalidate()
+                elif message['t'] == 'error':
+                    print(f"server: {message['msg']}")
+                elif message['t'] == 'closed':
+                    print("server: connection closed"); pygame.quit(); sys.exit()
+
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and seat is not None:
+                action = click_to_action(game_state, event.pos, button_rects, (seat,))
+                # 取り消しとリスタートはオンライン対戦では扱わない
+                if action and action[0] not in ('undo', 'restart'): send_message(sock, {'op': 'act', 'action': list(action)})
+
+        wake_times = []
+        if now >= next_frame_time:
+            dirty_rects = frame_renderer.render(screen, game_state, fonts, button_rects)
+            if dirty_rects:
+                pygame.display.update(dirty_rects); next_frame_time = now + frame_interval
+        else:
+            wake_times.append(next_frame_time)
+        blink_change = next_figure_bonus_change(game_state)
+        if blink_change is not None: wake_times.append(now + blink_change)
+        events = wait_for_events(max(0.0, min(wake_times) - time.monotonic()) if wake_times else None)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="対戦サーバーに接続する pygame クライアント")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--match', type=int, default=None, help="参加する対戦ID (省略時は空いている対戦に入る)")
+    parser.add_argument('--fps', type=int, default=DEFAULT_MAX_FPS, help="描画の上限フレームレート")
+    args = parser.parse_args()
+    main(args.host, args.port, args.match, max_fps=args.fps)
@@ -0,0 +1,196 @@
+import argparse
+import bisect
+import glob
+import os
+import random
+import time
+from multiprocessing import Pool
+import numpy as np
+from engine import BOARD_SIZE, GameState, EMPTY_CELL, STONE_CELL, RECOVERY_CELL, BOMB_CELL, ICE_CELL
+from replay import TURN_TYPES
+from ai import RandomAI
+from tournament import MAX_TURNS, make_policy
+
+# --- レコード形式 ---
+# 1レコード = ターン開始時 (ダイスを振った直後) の1局面と、そこで選ばれた行動と、その局の結果
+# planes: セル種別5枚 (空き・石・泉・爆弾・氷) + 手番側の位置 + 相手の位置 の 0/1 平面
+# player_pos / player_points は [P1, P2] の並び、player は手番のプレイヤー番号
+# 行動は 移動先と配置先のセル番号 (無ければ -1) と、replay.TURN_TYPES の配置種別コード
+# outcome は手番側から見た結果 (+1 勝ち / -1 負け / 0 未決着)
+PLANE_CELLS = np.array([EMPTY_CELL, STONE_CELL, RECOVERY_CELL, BOMB_CELL, ICE_CELL], dtype=np.int8)
+N_PLANES = len(PLANE_CELLS) + 2
+DEFAULT_SHARD_SIZE = 1 << 20
+SHARD_PATTERN = "shard-{writer:03d}-{index:05d}.npy"
+
+def record_dtype(size=BOARD_SIZE):
+    coord_type, cell_type = (np.int8, np.int16) if size <= 127 else (np.int16, np.int32)
+    return np.dtype([
+        ('planes', np.uint8, (N_PLANES, size, size)), ('player_pos', coord_type, (2, 2)), ('player_points', np.int32, (2,)),
+        ('dice_roll', np.int8), ('player', np.int8), ('dest', cell_type), ('p_type', np.int8), ('target', cell_type),
+        ('outcome', np.int8), ('game', np.int64), ('turn', np.int16),
+    ])
+
+def encode_position(record, state):
+    player = state.current_turn_player
+    np.equal(state.board, PLANE_CELLS[:, None, None], out=record['planes'][:len(PLANE_CELLS)].view(np.bool_))
+    position_planes = record['planes'][len(PLANE_CELLS):]
+    position_planes[:] = 0
+    position_planes[(0, 1), (state.player_pos[player][0], state.player_pos[3 - player][0]),
+                    (state.player_pos[player][1], state.player_pos[3 - player][1])] = 1
+    record['player_pos'] = (state.player_pos[1], state.player_pos[2])
+    record['player_points'] = (state.player_points[1], state.player_points[2])
+    record['dice_roll'], record['player'] = state.dice_roll, player
+
+# --- 書き込み ---
+# 固定長のシャードを open_memmap で確保してそのまま書き込む。1局分は局バッファ (numpy) に溜め、
+# 結果が決まってから outcome を埋めてシャードへ写す。最後の半端なシャードだけ close() で実際の長さに詰める
+class ShardWriter:
+    def __init__(self, directory, size=BOARD_SIZE, shard_size=DEFAULT_SHARD_SIZE, writer_id=0):
+        self.directory, self.shard_size, self.writer_id = directory, shard_size, writer_id
+        self.dtype = record_dtype(size)
+        self.shard, self.shard_index, self.filled, self.total = None, 0, 0, 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _shard_path(self, index):
+        return os.path.join(self.directory, SHARD_PATTERN.format(writer=self.writer_id, index=index))
+
+    def write(self, records):
+        while len(records):
+            if self.shard is None:
+                self.shard = np.lib.format.open_memmap(self._shard_path(self.shard_index), mode='w+', dtype=self.dtype,
+                                                       shape=(self.shard_size,))
+                self.filled = 0
+            count = min(len(records), self.shard_size - self.filled)
+            self.shard[self.filled:self.filled + count] = records[:count]
+            self.filled += count; self.total += count; records = records[count:]
+            if self.filled == self.shard_size:
+                self.shard.flush(); self.shard = None; self.shard_index += 1
+
+    def close(self):
+        if self.shard is None: return
+        path, partial = self._shard_path(self.shard_index), self.shard
+        self.shard = None
+        if self.filled:
+            trimmed = np.lib.format.open_memmap(path + ".tmp", mode='w+', dtype=self.dtype, shape=(self.filled,))
+            trimmed[:] = partial[:self.filled]; trimmed.flush()
+            del trimmed, partial
+            os.replace(path + ".tmp", path)
+        else:
+            del partial
+            os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# 1局を自己対戦しながら局バッファへ書き込み、使ったレコード数を返す
+def record_game(buffer, policies, seed, game_id, ice_skill=(True, True)):
+    state = GameState(seed=seed)
+    for player_num in (1, 2): state.select_starting_skill(player_num, 'ice_skill' if ice_skill[player_num - 1] else None)
+    count = 0
+    for _ in range(MAX_TURNS):
+        state.roll_dice()
+        if state.winner is not None: break
+        dest, p_type, target = turn = policies[state.current_turn_player].choose_turn(state)
+        record = buffer[count]
+        encode_position(record, state)
+        record['dest'] = -1 if p_type == 'fall' else dest[0] * state.size + dest[1]
+        record['target'] = -1 if target is None else target[0] * state.size + target[1]
+        record['p_type'], record['game'], record['turn'] = TURN_TYPES.index(p_type), game_id, count
+        count += 1
+        state.play_turn(turn)
+        if state.winner is not None: break
+    players = buffer['player'][:count]
+    buffer['outcome'][:count] = 0 if state.winner is None else np.where(players == state.winner, 1, -1)
+    return count
+
+def export_games(directory, seat_specs, start, count, seed, shard_size=DEFAULT_SHARD_SIZE, writer_id=0):
+    policies = {spec: make_policy(spec) for spec in set(seat_specs)}
+    buffer = np.zeros(MAX_TURNS, dtype=record_dtype())
+    with ShardWriter(directory, shard_size=shard_size, writer_id=writer_id) as writer:
+        for game_id in range(start, start + count):
+            seats = seat_specs[::-1] if game_id % 2 else seat_specs
+            game_seed = (seed * 1000003 + game_id) & 0x7FFFFFFFFFFFFFFF
+            for seat_index, spec in enumerate(seats):
+                if isinstance(policies[spec], RandomAI): policies[spec].rng.seed(game_seed + seat_index)
+            used = record_game(buffer, {1: policies[seats[0]], 2: policies[seats[1]]}, game_seed, game_id)
+            writer.write(buffer[:used])
+        return writer.total
+
+def _export_worker(args):
+    return export_games(*args)
+
+# --- 読み込み ---
+# 全シャードを mmap_mode='r' で開き、通し番号でアクセスできるようにする
+# 1シャード内に収まる添字・スライスはファイルへのビューをそのまま返す (シャードをまたぐスライスだけコピーになる)
+class ShardDataset:
+    def __init__(self, directory):
+        self.paths = sorted(glob.glob(os.path.join(directory, "shard-*.npy")))
+        self.shards = [np.load(path, mmap_mode='r') for path in self.paths]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards]).tolist()
+        self.dtype = self.shards[0].dtype if self.shards else record_dtype()
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def _locate(self, index):
+        shard = bisect.bisect_right(self.offsets, index) - 1
+        return shard, index - self.offsets[shard]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            # 刻み付きは両端を含む連続区間を読んでから間引く (負の刻みでは start > stop になるので端を入れ替える)
+            if step != 1:
+                indices = range(start, stop, step)
+                if not indices: return np.empty(0, dtype=self.dtype)
+                low, high = min(indices[0], indices[-1]), max(indices[0], indices[-1])
+                return self[low:high + 1][::step]
+            pieces = []
+            while start < stop:
+                shard, local = self._locate(start)
+                count = min(stop, self.offsets[shard + 1]) - start
+                pieces.append(self.shards[shard][local:local + count]); start += count
+            if not pieces: return np.empty(0, dtype=self.dtype)
+            return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+        if key < 0: key += len(self)
+        if not 0 <= key < len(self): raise IndexError(key)
+        shard, local = self._locate(key)
+        return self.shards[shard][local]
+
+    # シャード単位でビューのバッチを返す (バッチがシャードをまたがないのでコピーは起きない)
+    def iter_batches(self, batch_size):
+        for shard in self.shards:
+            for start in range(0, len(shard), batch_size):
+                yield shard[start:start + batch_size]
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="自己対戦の局面を memmap の .npy シャードへ書き出す")
+    parser.add_argument('directory')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--seat1', default='random', help="P1 の方策 (tournament.py と同じ書式)")
+    parser.add_argument('--seat2', default='random', help="P2 の方策")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help="1シャードのレコード数")
+    parser.add_argument('--jobs', type=int, default=1, help="書き出しプロセス数 (プロセスごとに別のシャード列を書く)")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else random.getrandbits(40)
+    seats = (args.seat1, args.seat2)
+    per_job = -(-args.games // args.jobs)
+    tasks = [(args.directory, seats, start, min(per_job, args.games - start), seed, args.shard_size, writer_id)
+             for writer_id, start in enumerate(range(0, args.games, per_job))]
+    start_time = time.perf_counter()
+    if args.jobs > 1:
+        with Pool(args.jobs) as pool: total = sum(pool.map(_export_worker, tasks))
+    else:
+        total = sum(_export_worker(task) for task in tasks)
+    elapsed = time.perf_counter() - start_time
+    dataset = ShardDataset(args.directory)
+    print(f"records: {total} ({len(dataset.paths)} shards, {len(dataset)} records on disk)")
+    print(f"elapsed: {elapsed:.2f}s ({total / elapsed:.0f} records/s)")
+
+if __name__ == '__main__':
+    main()
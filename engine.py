@@ -0,0 +1,509 @@
+import copy
+import numpy as np
+import random
+import struct
+
+# --- ルール定数 ---
+BOARD_SIZE = 9
+# 盤の一辺の範囲 (上限は局面・棋譜の圧縮形式が座標とセル番号をそれぞれ1バイト・2バイトで持つため)
+MIN_BOARD_SIZE = 7; MAX_BOARD_SIZE = 255
+# これより大きい盤では盤面全体のビットマスクや前計算テーブルを持たず、必要なマスの周りだけを都度調べる
+BITMASK_MAX_SIZE = 32
+DEFAULT_SKILL_COSTS = {'recovery': 100, 'bomb': 50, 'drill': 200, 'ice': 100}
+RECOVERY_POINTS = 20; TURN_POINTS = 10; FIGURE_BONUS_POINTS = 10
+# 図形ボーナスの強調表示を続ける時間 (秒)
+FIGURE_BONUS_DURATION = 1.5
+FIGURE_SHAPES = (
+    ((0,0), (1,0), (2,0), (0,1), (2,1)), ((0,0), (2,0), (0,1), (1,1), (2,1)),
+    ((0,0), (1,0), (0,1), (0,2), (1,2)), ((0,0), (0,2), (1,0), (1,1), (1,2))
+)
+DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+SKILL_PLACEMENTS = ('recovery', 'bomb', 'ice')
+# 敗因
+REASON_BOMB = "stepped on a bomb!"; REASON_FALL = "fell off the cliff!"
+REASON_BLOCKED = "is blocked and cannot move!"; REASON_NO_PLACE = "has no place to put an object!"
+
+# --- マーカー定義 ---
+STONE_MARKER = "S"; RECOVERY_MARKER = "R"; BOMB_MARKER = "B"; ICE_MARKER = "I"; EMPTY_MARKER = " "
+# 盤面はint8のセルコードで保持する (マーカー文字列は互換ビュー用)
+EMPTY_CELL = 0; STONE_CELL = 1; RECOVERY_CELL = 2; BOMB_CELL = 3; ICE_CELL = 4
+CELL_MARKERS = np.array([EMPTY_MARKER, STONE_MARKER, RECOVERY_MARKER, BOMB_MARKER, ICE_MARKER], dtype=object)
+MARKER_CELLS = {marker: code for code, marker in enumerate(CELL_MARKERS)}
+PLACEMENT_CELLS = {'stone': STONE_CELL, 'recovery': RECOVERY_CELL, 'bomb': BOMB_CELL, 'ice': ICE_CELL}
+
+# --- 局面の圧縮形式 ---
+# 盤面は1セル4bitで詰め、残りは サイズ, 両プレイヤー座標, 両者の得点, ダイス+勝者, フェーズ+配置種別+スキル
+PHASES = ("skill_selection", "roll", "move", "place", "drill_target", "game_over")
+PLACEMENT_TYPES = ('stone', 'recovery', 'bomb', 'drill', 'ice')
+POSITION_HEADER = struct.Struct("<5B2IBB")
+
+# --- ヘルパー関数 ---
+# --- 初期配置の規則 ---
+# 泉は各プレイヤー側の列帯から開始位置と FOUNTAIN_MIN_DISTANCE 以上離れた所、石はプレイヤー周囲3x3と泉を除いた所
+FOUNTAIN_MIN_DISTANCE = 4
+INITIAL_STONES = 3
+
+def fountain_region(size, player_num):
+    return (0, size), ((0, size // 2 - 1) if player_num == 1 else (size // 2 + 2, size))
+
+def stone_banned_cells(player_pos, fountains):
+    banned = set(fountains) | set(player_pos.values())
+    for r, c in player_pos.values():
+        banned.update((r + r_off, c + c_off) for r_off in (-1, 0, 1) for c_off in (-1, 0, 1))
+    return banned
+
+def _manhattan_distance(pos1, pos2):
+    return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
+
+# シード付きの対局のダイスは (シード, ターン番号) だけで決める (取り消してから振り直しても目は変わらない)
+def seeded_dice(seed, turn_number):
+    x = (seed + (turn_number + 1) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return (x ^ (x >> 31)) % 3 + 1
+
+# --- 図形インデックス ---
+# 盤面の各マスから、そのマスを含む全ての図形配置 (ビットマスク, 座標) を引けるようにしておく
+# 石のビットマスクと AND を取るだけで図形ボーナスを判定できる
+# BITMASK_MAX_SIZE を超える盤では前計算せず、置いたマスを含む配置だけをその場で作って盤面を直接調べる
+class ShapeIndex:
+    def __init__(self, size=BOARD_SIZE, shapes=FIGURE_SHAPES):
+        self.size, self.local = size, size > BITMASK_MAX_SIZE
+        self.placements = []
+        self.cell_placements = [[] for _ in range(size * size)] if not self.local else None
+        self.shapes = []
+        self._known_masks = set()
+        for shape in shapes: self.register_shape(shape)
+
+    def register_shape(self, shape):
+        min_r, min_c = min(dr for dr, _ in shape), min(dc for _, dc in shape)
+        shape = [(dr - min_r, dc - min_c) for dr, dc in shape]
+        self.shapes.append(tuple(shape))
+        if self.local: return
+        height, width = max(dr for dr, _ in shape) + 1, max(dc for _, dc in shape) + 1
+        for tl_r in range(self.size - height + 1):
+            for tl_c in range(self.size - width + 1):
+                coords = tuple((tl_r + dr, tl_c + dc) for dr, dc in shape)
+                mask = sum(1 << (r * self.size + c) for r, c in coords)
+                if mask in self._known_masks: continue
+                self._known_masks.add(mask); self.placements.append((mask, coords))
+                for r, c in coords: self.cell_placements[r * self.size + c].append((mask, coords))
+
+    def completed_shapes(self, stone_mask, r, c):
+        return [coords for mask, coords in self.cell_placements[r * self.size + c] if stone_mask & mask == mask]
+
+    # 大きい盤用: (r, c) を含む盤内の配置を列挙し、全マスが石のものを返す
+    def completed_shapes_on_board(self, board, r, c):
+        found, seen = [], set()
+        for shape in self.shapes:
+            for dr, dc in shape:
+                coords = tuple((r - dr + sr, c - dc + sc) for sr, sc in shape)
+                if any(not (0 <= cr < self.size and 0 <= cc < self.size) for cr, cc in coords): continue
+                key = frozenset(coords)
+                if key in seen: continue
+                seen.add(key)
+                if all(board[pos] == STONE_CELL for pos in coords): found.append(coords)
+        return found
+
+_shape_indexes = {}
+def get_shape_index(size=BOARD_SIZE):
+    if size not in _shape_indexes: _shape_indexes[size] = ShapeIndex(size)
+    return _shape_indexes[size]
+
+# --- 盤面テーブル ---
+# 各マスから上下左右へ伸びる光線 (盤端までのマス列) と隣接マスを前計算しておく
+# BITMASK_MAX_SIZE を超える盤では前計算せず、引かれたマスの分だけその場で作る (光線は必要な所まで辿る生成器)
+def _walk_ray(r, c, dr, dc, size):
+    r, c = r + dr, c + dc
+    while 0 <= r < size and 0 <= c < size:
+        yield (r, c); r, c = r + dr, c + dc
+
+class _LocalRays:
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, cell):
+        r, c = divmod(cell, self.size)
+        return tuple(_walk_ray(r, c, dr, dc, self.size) for dr, dc in DIRECTIONS)
+
+class _LocalNeighbors:
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, cell):
+        r, c = divmod(cell, self.size)
+        return tuple((r + dr, c + dc) for dr, dc in DIRECTIONS if 0 <= r + dr < self.size and 0 <= c + dc < self.size)
+
+class BoardTables:
+    def __init__(self, size=BOARD_SIZE):
+        self.size = size
+        if size > BITMASK_MAX_SIZE:
+            self.rays, self.neighbors = _LocalRays(size), _LocalNeighbors(size)
+            return
+        self.rays, self.neighbors = [], []
+        for r in range(size):
+            for c in range(size):
+                rays = []
+                for dr, dc in DIRECTIONS:
+                    ray, nr, nc = [], r + dr, c + dc
+                    while 0 <= nr < size and 0 <= nc < size:
+                        ray.append((nr, nc)); nr, nc = nr + dr, nc + dc
+                    rays.append(tuple(ray))
+                self.rays.append(tuple(rays))
+                self.neighbors.append(tuple(ray[0] for ray in rays if ray))
+
+_board_tables = {}
+def get_board_tables(size=BOARD_SIZE):
+    if size not in _board_tables: _board_tables[size] = BoardTables(size)
+    return _board_tables[size]
+
+def stone_mask_of(board):
+    if board.shape[0] > BITMASK_MAX_SIZE: return None
+    return sum(1 << int(i) for i in np.flatnonzero(board.ravel() == STONE_CELL))
+
+# --- ゲーム状態を管理するクラス ---
+# seed を渡すと初期配置はその対局専用の乱数で、ダイスは seeded_dice で決める (省略時はモジュールの random を使う)
+# opening_book を渡すと初期配置はその定跡 (opening.OpeningBook) から1つ引く
+class GameState:
+    def __init__(self, size=BOARD_SIZE, seed=None, opening_book=None):
+        if not MIN_BOARD_SIZE <= size <= MAX_BOARD_SIZE:
+            raise ValueError(f"board size must be between {MIN_BOARD_SIZE} and {MAX_BOARD_SIZE}: {size}")
+        if opening_book is not None and opening_book.size != size:
+            raise ValueError(f"opening book is for {opening_book.size}x{opening_book.size} boards, not {size}x{size}")
+        self.size, self.seed, self.opening_book = size, seed, opening_book
+        # 初期配置用の乱数。シード付きなら初期配置が済んだ時点で None にする
+        self.rng = random.Random(seed) if seed is not None else random
+        self.board = np.full((size, size), EMPTY_CELL, dtype=np.int8)
+        # 大きい盤では石のビットマスクを持たない (stone_mask は None)
+        self.stone_mask = 0 if size <= BITMASK_MAX_SIZE else None
+        self.shape_index, self.tables = get_shape_index(size), get_board_tables(size)
+        self.player_pos = {1: (size // 2, 0), 2: (size // 2, size - 1)}
+        self.player_points = {1: 0, 2: 0}
+        self.skill_costs = dict(DEFAULT_SKILL_COSTS)
+        self.special_skill = {1: None, 2: None}
+        self.selection_confirmed = {1: False, 2: False}
+        self.current_phase = "skill_selection"
+        self.current_turn_player = 1
+        self.dice_roll, self.turn_number = 0, 0
+        self.placement_type = 'stone'
+        self.movable_tiles, self.placeable_tiles, self.fall_trigger_tiles, self.drill_target_tiles = [], [], [], []
+        self.winner, self.win_reason = None, ""
+        self.figure_bonus_tiles, self.figure_bonus_timer = [], 0
+        self.undo_stack, self._cell_log = [], None
+        # record_turns() 後は1ターンごとに (ダイス, 移動先, 配置種別, 配置先) を turn_log に積む
+        self.turn_log, self._turn = None, None
+        # 定跡から配置したときだけ、最初の手番開始時の局面 (pack()) を残す (シードからは初期配置を再現できないため)
+        self.opening_position = None
+
+    def record_turns(self):
+        self.turn_log, self._turn = [], None
+
+    def _log_turn(self):
+        if self._turn is not None:
+            self.turn_log.append(self._turn); self._turn = None
+
+    def _set_cell(self, r, c, code):
+        if self._cell_log is not None: self._cell_log.append((r, c, self.board[r, c]))
+        if self.stone_mask is not None:
+            bit = 1 << (r * self.size + c)
+            self.stone_mask = self.stone_mask | bit if code == STONE_CELL else self.stone_mask & ~bit
+        self.board[r, c] = code
+
+    # --- 取り消し (make/unmake) ---
+    # push_undo() 以降の変更は、変更されたセルと手番まわりの値だけを記録したタプルで取り消せる
+    # ハイライトのリストは常に新しいリストへ差し替えられるので、参照を保存するだけでよい
+    def push_undo(self):
+        self._cell_log = []
+        self.undo_stack.append((
+            self._cell_log, self.stone_mask, self.player_pos[1], self.player_pos[2], self.player_points[1], self.player_points[2],
+            self.current_turn_player, self.current_phase, self.dice_roll, self.turn_number, self.placement_type, self.winner, self.win_reason,
+            self.movable_tiles, self.placeable_tiles, self.fall_trigger_tiles, self.drill_target_tiles,
+            self.figure_bonus_tiles, self.figure_bonus_timer, self._turn, len(self.turn_log) if self.turn_log is not None else 0))
+
+    def undo(self):
+        (cells, self.stone_mask, pos1, pos2, pts1, pts2, self.current_turn_player, self.current_phase, self.dice_roll,
+         self.turn_number, self.placement_type, self.winner, self.win_reason, self.movable_tiles, self.placeable_tiles, self.fall_trigger_tiles,
+         self.drill_target_tiles, self.figure_bonus_tiles, self.figure_bonus_timer, self._turn, logged_turns) = self.undo_stack.pop()
+        if self.turn_log is not None: del self.turn_log[logged_turns:]
+        for r, c, code in reversed(cells): self.board[r, c] = code
+        self.player_pos[1], self.player_pos[2] = pos1, pos2
+        self.player_points[1], self.player_points[2] = pts1, pts2
+        self._cell_log = self.undo_stack[-1][0] if self.undo_stack else None
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def marker_board(self):
+        return CELL_MARKERS[self.board]
+
+    def copy(self):
+        clone = copy.copy(self)
+        clone.board = self.board.copy()
+        clone.player_pos, clone.player_points = dict(self.player_pos), dict(self.player_points)
+        clone.skill_costs, clone.special_skill = dict(self.skill_costs), dict(self.special_skill)
+        clone.selection_confirmed = dict(self.selection_confirmed)
+        clone.movable_tiles, clone.placeable_tiles = list(self.movable_tiles), list(self.placeable_tiles)
+        clone.fall_trigger_tiles, clone.drill_target_tiles = list(self.fall_trigger_tiles), list(self.drill_target_tiles)
+        clone.figure_bonus_tiles = list(self.figure_bonus_tiles)
+        clone.undo_stack, clone._cell_log = [], None
+        clone.turn_log, clone._turn = None, None
+        return clone
+
+    def pack(self):
+        size = self.board.shape[0]
+        cells = self.board.ravel().astype(np.uint8)
+        if cells.size % 2: cells = np.append(cells, np.uint8(EMPTY_CELL))
+        (r1, c1), (r2, c2) = self.player_pos[1], self.player_pos[2]
+        skills = (self.special_skill[1] == 'ice_skill') | (self.special_skill[2] == 'ice_skill') << 1
+        flags = PHASES.index(self.current_phase) | PLACEMENT_TYPES.index(self.placement_type) << 3 | skills << 6
+        header = POSITION_HEADER.pack(size, r1, c1, r2, c2, self.player_points[1], self.player_points[2],
+                                      self.dice_roll | (self.winner or 0) << 2 | self.current_turn_player << 4, flags)
+        return header + ((cells[0::2] << 4) | cells[1::2]).tobytes()
+
+    @classmethod
+    def unpack(cls, data):
+        size, r1, c1, r2, c2, pts1, pts2, turn_info, flags = POSITION_HEADER.unpack_from(data)
+        state = cls(size)
+        packed = np.frombuffer(data, dtype=np.uint8, offset=POSITION_HEADER.size)
+        cells = np.empty(packed.size * 2, dtype=np.int8); cells[0::2] = packed >> 4; cells[1::2] = packed & 0x0F
+        state.board = cells[:size * size].reshape(size, size)
+        state.stone_mask = stone_mask_of(state.board)
+        state.player_pos = {1: (r1, c1), 2: (r2, c2)}
+        state.player_points = {1: pts1, 2: pts2}
+        state.dice_roll, state.winner, state.current_turn_player = turn_info & 0x03, (turn_info >> 2) & 0x03 or None, turn_info >> 4
+        state.current_phase, state.placement_type = PHASES[flags & 0x07], PLACEMENT_TYPES[(flags >> 3) & 0x07]
+        state.special_skill = {1: 'ice_skill' if flags & 0x40 else None, 2: 'ice_skill' if flags & 0x80 else None}
+        state.selection_confirmed = {1: state.current_phase != "skill_selection", 2: state.current_phase != "skill_selection"}
+        return state
+
+    # 大きい盤では候補の一覧を作らず、条件を満たすまで一様に引き直す
+    def _random_spots(self, count, row_range, col_range, accept):
+        if self.size <= BITMASK_MAX_SIZE:
+            spots = [(r, c) for r in range(*row_range) for c in range(*col_range) if accept((r, c))]
+            return [self.rng.choice(spots)] if count == 1 else self.rng.sample(spots, count)
+        picked = []
+        while len(picked) < count:
+            pos = (self.rng.randrange(*row_range), self.rng.randrange(*col_range))
+            if accept(pos) and pos not in picked: picked.append(pos)
+        return picked
+
+    # 定跡があれば1件引いて置くだけ (探索はしない)。無ければ規則の範囲から無作為に選び、先手は泉までの距離で決める
+    def _setup_initial_board(self):
+        if self.opening_book is not None:
+            fountains, stones, first_player = self.opening_book.draw(self.rng)
+            for pos in fountains: self._set_cell(*pos, RECOVERY_CELL)
+            for pos in stones: self._set_cell(*pos, STONE_CELL)
+            self.current_turn_player = first_player
+            return
+        p1_pos, p2_pos = self.player_pos[1], self.player_pos[2]
+        size = self.size
+        p1_fountain_pos, = self._random_spots(1, *fountain_region(size, 1),
+                                              lambda pos: _manhattan_distance(p1_pos, pos) >= FOUNTAIN_MIN_DISTANCE)
+        self._set_cell(*p1_fountain_pos, RECOVERY_CELL)
+        p2_fountain_pos, = self._random_spots(1, *fountain_region(size, 2),
+                                              lambda pos: _manhattan_distance(p2_pos, pos) >= FOUNTAIN_MIN_DISTANCE)
+        self._set_cell(*p2_fountain_pos, RECOVERY_CELL)
+        dist1, dist2 = _manhattan_distance(p1_pos, p1_fountain_pos), _manhattan_distance(p2_pos, p2_fountain_pos)
+        self.current_turn_player = 1 if dist1 > dist2 else 2 if dist2 > dist1 else self.rng.choice([1, 2])
+        banned = stone_banned_cells(self.player_pos, (p1_fountain_pos, p2_fountain_pos))
+        for pos in self._random_spots(INITIAL_STONES, (0, size), (0, size), lambda pos: pos not in banned):
+            self._set_cell(*pos, STONE_CELL)
+
+    def select_starting_skill(self, player_num, skill_type):
+        if not self.selection_confirmed[player_num]:
+            self.special_skill[player_num] = skill_type
+            self.selection_confirmed[player_num] = True
+        if all(self.selection_confirmed.values()):
+            self._setup_initial_board()
+            self.current_phase = "roll"
+            if self.opening_book is not None: self.opening_position = self.pack()
+            # シード付きの対局で乱数を使うのは初期配置だけ (ダイスは seeded_dice) なので、ここで手放して対局ごとの保持量を減らす
+            if self.seed is not None: self.rng = None
+
+    def roll_dice(self, value=None):
+        self.dice_roll = value or (seeded_dice(self.seed, self.turn_number) if self.seed is not None else random.randint(1, 3))
+        if self.turn_log is not None: self._turn = (self.dice_roll, None, None, None)
+        self.find_movable_tiles()
+        if self.winner is None: self.current_phase = "move"
+
+    # --- 合法手の列挙 ---
+    # 前計算した光線を辿り、ダイスの歩数で止まるマス (移動先) と盤外へ出てしまうマス (落下) を返す
+    # 光線上で同じ氷を二度踏むことはないので、氷を踏むたびに歩数を1つ延ばすだけでよい
+    def _scan_moves(self, dice):
+        moves, falls = [], []
+        board, other_player_pos = self.board, self.player_pos[2 if self.current_turn_player == 1 else 1]
+        player_r, player_c = self.player_pos[self.current_turn_player]
+        for ray in self.tables.rays[player_r * self.size + player_c]:
+            steps_left, final_dest = dice, None
+            for pos in ray:
+                cell = board[pos]
+                if cell == STONE_CELL or pos == other_player_pos: break
+                final_dest = pos
+                if cell != ICE_CELL: steps_left -= 1
+                if steps_left == 0: break
+            else:
+                if final_dest: falls.append(final_dest)
+                continue
+            if final_dest: moves.append(final_dest)
+        return moves, falls
+
+    def _placement_targets(self, pos, p_type):
+        board, other_player_pos = self.board, self.player_pos[2 if self.current_turn_player == 1 else 1]
+        neighbors = self.tables.neighbors[pos[0] * self.size + pos[1]]
+        if p_type == 'drill': return [n for n in neighbors if board[n] == STONE_CELL]
+        if p_type == 'stone': return [n for n in neighbors if n != other_player_pos and board[n] != STONE_CELL]
+        if p_type in SKILL_PLACEMENTS: return [n for n in neighbors if n != other_player_pos and board[n] == EMPTY_CELL]
+        return []
+
+    # 1ターン分の行動 (移動先, 配置種別, 配置先) を全て列挙する
+    # 配置種別 'fall' は崖からの落下、None は移動した時点で負けが確定する手 (爆弾・置き場所なし)
+    def iter_turns(self, dice=None):
+        if self.winner is not None: return
+        player = self.current_turn_player
+        moves, falls = self._scan_moves(dice or self.dice_roll)
+        skills = SKILL_PLACEMENTS if self.special_skill[player] == 'ice_skill' else SKILL_PLACEMENTS[:2]
+        for dest in moves:
+            dest_type = self.board[dest]
+            if dest_type == BOMB_CELL:
+                yield (dest, None, None); continue
+            stone_targets = self._placement_targets(dest, 'stone')
+            if not stone_targets:
+                yield (dest, None, None); continue
+            for target in stone_targets: yield (dest, 'stone', target)
+            points = self.player_points[player] + (RECOVERY_POINTS if dest_type == RECOVERY_CELL else 0)
+            affordable = [p_type for p_type in skills if points >= self.skill_costs[p_type]]
+            if affordable:
+                empty_targets = self._placement_targets(dest, 'recovery')
+                for p_type in affordable:
+                    for target in empty_targets: yield (dest, p_type, target)
+            if points >= self.skill_costs['drill']:
+                for target in self._placement_targets(dest, 'drill'): yield (dest, 'drill', target)
+        for dest in falls: yield (dest, 'fall', None)
+
+    def play_turn(self, turn):
+        dest, p_type, target = turn
+        if p_type == 'fall':
+            self.fall_off_cliff(); return
+        self.move_player(*dest)
+        if self.winner is not None: return
+        if p_type == 'drill':
+            self.set_placement_type('drill'); self.use_drill(*target)
+        else:
+            if p_type != 'stone': self.set_placement_type(p_type)
+            self.place_object(*target)
+
+    # --- 操作 ---
+    # UI やネットワークから来る操作タプルを検証して適用する。適用できなければ False を返す
+    # ('skill', プレイヤー, スキル) / ('roll',) / ('move', r, c) / ('placement', 種別) / ('place', r, c) / ('drill', r, c)
+    def perform(self, action, dice=None, record_undo=False):
+        kind = action[0]
+        if kind == 'skill':
+            player_num, skill_type = action[1], action[2]
+            if self.current_phase != "skill_selection" or player_num not in (1, 2) or self.selection_confirmed[player_num]: return False
+            self.select_starting_skill(player_num, skill_type); return True
+        if self.winner is not None: return False
+        if kind == 'roll':
+            if self.current_phase != "roll": return False
+            self.roll_dice(dice); return True
+        if kind == 'placement':
+            p_type = action[1]
+            if self.current_phase not in ('place', 'drill_target') or p_type not in PLACEMENT_TYPES: return False
+            if p_type == 'ice' and self.special_skill[self.current_turn_player] != 'ice_skill': return False
+            self.set_placement_type(p_type); return True
+        pos = (action[1], action[2])
+        if kind == 'move' and self.current_phase == "move":
+            if pos in self.fall_trigger_tiles: step = self.fall_off_cliff
+            elif pos in self.movable_tiles: step = lambda: self.move_player(*pos)
+            else: return False
+        elif kind == 'place' and self.current_phase == 'place' and pos in self.placeable_tiles:
+            step = lambda: self.place_object(*pos)
+        elif kind == 'drill' and self.current_phase == 'drill_target' and pos in self.drill_target_tiles:
+            step = lambda: self.use_drill(*pos)
+        else:
+            return False
+        if record_undo: self.push_undo()
+        step(); return True
+
+    def find_movable_tiles(self):
+        self.movable_tiles, self.fall_trigger_tiles = self._scan_moves(self.dice_roll)
+        if not self.movable_tiles and not self.fall_trigger_tiles:
+            self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason=REASON_BLOCKED)
+
+    def move_player(self, new_r, new_c):
+        if self._turn is not None: self._turn = (self._turn[0], (new_r, new_c), None, None)
+        dest_type = self.board[new_r, new_c]
+        if dest_type == BOMB_CELL:
+            self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason=REASON_BOMB)
+            return
+        self.player_pos[self.current_turn_player] = (new_r, new_c)
+        if dest_type == RECOVERY_CELL: self.player_points[self.current_turn_player] += RECOVERY_POINTS
+        self.current_phase = "place"; self.placement_type = 'stone'
+        self.clear_highlights(); self.find_placeable_tiles()
+
+    def fall_off_cliff(self):
+        if self._turn is not None: self._turn = (self._turn[0], None, 'fall', None)
+        self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason=REASON_FALL)
+
+    def set_placement_type(self, p_type):
+        cost = self.skill_costs.get(p_type)
+        if cost is not None and self.player_points[self.current_turn_player] < cost: return
+        self.placement_type = p_type
+        if p_type == 'drill':
+            self.current_phase = 'drill_target'; self.find_drill_target_tiles()
+        else:
+            self.current_phase = 'place'; self.find_placeable_tiles()
+
+    def find_placeable_tiles(self):
+        self.drill_target_tiles = []
+        self.placeable_tiles = self._placement_targets(self.player_pos[self.current_turn_player], self.placement_type)
+        if not self.placeable_tiles and self.winner is None:
+            # 石以外を選んで置き場所が無かった負けは、選んだ種別ごと記録する (配置先は None)
+            if self._turn is not None and self.placement_type != 'stone': self._turn = self._turn[:2] + (self.placement_type, None)
+            self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason=REASON_NO_PLACE)
+
+    def place_object(self, r, c):
+        if self._turn is not None: self._turn = self._turn[:2] + (self.placement_type, (r, c))
+        if self.placement_type == 'stone':
+            self._set_cell(r, c, STONE_CELL)
+            bonus_count, bonus_coords = self.check_figure_bonus(r, c)
+            if bonus_count > 0:
+                self.player_points[self.current_turn_player] += FIGURE_BONUS_POINTS * bonus_count
+                self.figure_bonus_tiles, self.figure_bonus_timer = bonus_coords, FIGURE_BONUS_DURATION
+        else:
+            self.player_points[self.current_turn_player] -= self.skill_costs[self.placement_type]
+            self._set_cell(r, c, PLACEMENT_CELLS[self.placement_type])
+        self.end_turn()
+
+    def check_figure_bonus(self, r, c):
+        if self.stone_mask is None: found_shapes = self.shape_index.completed_shapes_on_board(self.board, r, c)
+        else: found_shapes = self.shape_index.completed_shapes(self.stone_mask, r, c)
+        if not found_shapes: return 0, []
+        all_bonus_coords = set().union(*found_shapes)
+        return len(found_shapes), list(all_bonus_coords)
+
+    def find_drill_target_tiles(self):
+        self.placeable_tiles = []
+        self.drill_target_tiles = self._placement_targets(self.player_pos[self.current_turn_player], 'drill')
+        if not self.drill_target_tiles: print("破壊できる石がありません")
+
+    def use_drill(self, r, c):
+        if self._turn is not None: self._turn = self._turn[:2] + ('drill', (r, c))
+        self.player_points[self.current_turn_player] -= self.skill_costs['drill']
+        self._set_cell(r, c, EMPTY_CELL)
+        self.end_turn()
+
+    def end_turn(self):
+        if self._turn is not None: self._log_turn()
+        self.current_turn_player = 2 if self.current_turn_player == 1 else 1
+        self.player_points[self.current_turn_player] += TURN_POINTS
+        self.current_phase = "roll"; self.dice_roll = 0; self.turn_number += 1
+        self.clear_highlights()
+
+    def clear_highlights(self):
+        self.movable_tiles, self.placeable_tiles, self.fall_trigger_tiles, self.drill_target_tiles = [], [], [], []
+
+    def game_over(self, winner, reason):
+        if self.winner is None:
+            loser = 1 if winner == 2 else 2
+            self.winner = winner; self.win_reason = f"Player {loser} {reason}"; self.current_phase = "game_over"
+            if self._turn is not None: self._log_turn()
@@ -0,0 +1,128 @@
+import argparse
+import os
+import random
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+import numpy as np
+from engine import (BOARD_SIZE, GameState, DEFAULT_SKILL_COSTS, FOUNTAIN_MIN_DISTANCE, INITIAL_STONES, fountain_region,
+                    stone_banned_cells)
+from ai import RandomAI
+from opening import OpeningBook
+from tournament import make_policy, play_game
+
+# --- 定数定義 ---
+DEFAULT_STONES_PER_PAIR = 8
+DEFAULT_GAMES = 32
+DEFAULT_TOLERANCE = 0.1
+DEFAULT_CHUNK_SIZE = 16
+
+# --- 候補の列挙 ---
+# 泉の組は規則どおりに全て、先手は両方を試す。石は泉の組ごとに決まった種から stones_per_pair 通りを引く
+# (石の組み合わせは 9×9 でも泉1組あたり数万通りあり、全てを対局で評価するのは現実的でないため)
+def fountain_spots(size, player_num):
+    start = GameState(size).player_pos[player_num]
+    (r0, r1), (c0, c1) = fountain_region(size, player_num)
+    return [(r, c) for r in range(r0, r1) for c in range(c0, c1)
+            if abs(r - start[0]) + abs(c - start[1]) >= FOUNTAIN_MIN_DISTANCE]
+
+def candidate_openings(size=BOARD_SIZE, stones_per_pair=DEFAULT_STONES_PER_PAIR, seed=0):
+    player_pos = GameState(size).player_pos
+    entries = []
+    for f1 in fountain_spots(size, 1):
+        for f2 in fountain_spots(size, 2):
+            banned = stone_banned_cells(player_pos, (f1, f2))
+            free = [r * size + c for r in range(size) for c in range(size) if (r, c) not in banned]
+            rng = random.Random(f"{seed}:{f1}:{f2}")
+            for _ in range(stones_per_pair):
+                stones = sorted(rng.sample(free, INITIAL_STONES))
+                for first_player in (1, 2):
+                    entries.append(((f1[0] * size + f1[1], f2[0] * size + f2[1]), stones, first_player, 0))
+    return OpeningBook(size, entries)
+
+# --- ワーカープロセス ---
+# 方策と候補の一覧はプロセスごとに1度だけ受け取り、タスクは (先頭の添字, 個数) だけにする
+_worker = {}
+
+def _init_worker(candidates, policy_spec, games, seed):
+    _worker.update(candidates=candidates, games=games, seed=seed,
+                   policies={1: make_policy(policy_spec), 2: make_policy(policy_spec)})
+
+# 1つの候補から同じ方策どうしで games 局を打ち、P1 の勝ち数 (未決着は 0.5) を返す
+def play_opening(index):
+    candidates, policies, seed = _worker['candidates'], _worker['policies'], _worker['seed']
+    single = OpeningBook(candidates.size, candidates.entries[index:index + 1])
+    p1_wins = 0.0
+    for game in range(_worker['games']):
+        game_seed = (seed * 1000003 + index * 65537 + game) & 0x7FFFFFFFFFFFFFFF
+        for player_num, policy in policies.items():
+            if isinstance(policy, RandomAI): policy.rng.seed(game_seed + player_num)
+        state = play_game(policies, game_seed, DEFAULT_SKILL_COSTS, (True, True), opening_book=single)[0]
+        p1_wins += 1.0 if state.winner == 1 else 0.5 if state.winner is None else 0.0
+    return p1_wins
+
+def play_chunk(chunk):
+    start, count = chunk
+    return start, [play_opening(index) for index in range(start, start + count)]
+
+# --- 解析 ---
+# 全候補の P1 勝率を求め、候補の p1_win_rate にも書き込む
+def analyze(candidates, games=DEFAULT_GAMES, policy_spec='greedy', seed=0, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE,
+            progress=None):
+    rates = np.zeros(len(candidates))
+    chunks = [(start, min(chunk_size, len(candidates) - start)) for start in range(0, len(candidates), chunk_size)]
+    done = 0
+    with Pool(jobs or os.cpu_count(), initializer=_init_worker, initargs=(candidates, policy_spec, games, seed)) as pool:
+        for start, wins in pool.imap_unordered(play_chunk, chunks):
+            rates[start:start + len(wins)] = np.array(wins) / games
+            done += len(wins)
+            if progress: progress(done, len(candidates))
+    candidates.entries['p1_win_rate'] = np.round(rates * 0xFFFF).astype(np.uint16)
+    candidates.games = games
+    return rates
+
+# P1 勝率が 0.5 から tolerance 以内の候補だけを残した定跡
+def balanced_book(candidates, rates, tolerance=DEFAULT_TOLERANCE):
+    return OpeningBook(candidates.size, candidates.entries[np.abs(rates - 0.5) <= tolerance], candidates.games)
+
+# 先手と泉までの距離の差 (P1 - P2、±3 で打ち切り) ごとの P1 勝率。今の距離で先手を決める規則の偏りが見える
+def summarize(candidates, rates):
+    start = GameState(candidates.size).player_pos
+    groups = defaultdict(list)
+    for index in range(len(candidates)):
+        (f1, f2), _, first_player = candidates.opening(index)
+        gap = abs(f1[0] - start[1][0]) + abs(f1[1] - start[1][1]) - abs(f2[0] - start[2][0]) - abs(f2[1] - start[2][1])
+        groups[first_player, max(-3, min(3, gap))].append(rates[index])
+    return {key: float(np.mean(values)) for key, values in sorted(groups.items())}
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="初期配置の公平さを自己対戦で解析し、釣り合った定跡ファイルを作る")
+    parser.add_argument('output', help="書き出す定跡ファイル")
+    parser.add_argument('--size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--stones-per-pair', type=int, default=DEFAULT_STONES_PER_PAIR, help="泉の組ごとに試す石の配置数")
+    parser.add_argument('--games', type=int, default=DEFAULT_GAMES, help="候補1つあたりの対局数")
+    parser.add_argument('--policy', default='greedy', help="両者の方策 (tournament.py と同じ書式)")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help="残す候補の P1 勝率の 0.5 からのずれ")
+    parser.add_argument('--jobs', type=int, default=None, help="ワーカープロセス数 (既定は全コア)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    candidates = candidate_openings(args.size, args.stones_per_pair, args.seed)
+    print(f"candidates: {len(candidates)} ({args.games} games each, policy {args.policy})")
+    start = time.perf_counter()
+    def progress(done, total):
+        print(f"\r{done}/{total} openings", end="", flush=True)
+    rates = analyze(candidates, args.games, args.policy, args.seed, args.jobs, args.chunk_size, progress)
+    print()
+    for (first_player, gap), rate in summarize(candidates, rates).items():
+        print(f"first P{first_player}, fountain distance P1-P2 {gap:+d}: P1 win rate {rate:.3f}")
+    book = balanced_book(candidates, rates, args.tolerance)
+    if not len(book): raise SystemExit("no balanced openings; raise --tolerance or --games")
+    book.save(args.output)
+    print(f"kept {len(book)}/{len(candidates)} openings ({os.path.getsize(args.output)} bytes), "
+          f"P1 win rate {rates.mean():.3f} over all candidates, {rates[np.abs(rates - 0.5) <= args.tolerance].mean():.3f} in the book")
+    print(f"elapsed: {time.perf_counter() - start:.2f}s")
+
+if __name__ == '__main__':
+    main()
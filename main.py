@@ -1,17 +1,31 @@
 import pygame
 import sys
-import numpy as np
+import argparse
+import time
 import random
+import numpy as np
+from collections import OrderedDict
+from contextlib import nullcontext
+from ai import ExpectimaxAI, DEFAULT_TIME_BUDGET
+from replay import Replay, ReplayError, iter_replays, write_replays
+from winprob import WinProbabilityEstimator
+from profiling import Profiler, instrument
+from assets import IconAtlas
+from opening import OpeningBook
+from engine import (BOARD_SIZE, MIN_BOARD_SIZE, MAX_BOARD_SIZE, GameState, STONE_CELL, RECOVERY_CELL, BOMB_CELL, ICE_CELL)
 
 # --- 定数定義 ---
 PANEL_WIDTH = 280
 BOARD_WIDTH = 720
 SCREEN_WIDTH = BOARD_WIDTH + PANEL_WIDTH * 2
 SCREEN_HEIGHT = 800
-BOARD_SIZE = 9
 CELL_SIZE = 80
 BOARD_OFFSET_X = PANEL_WIDTH
 BOARD_OFFSET_Y = 40
+BOARD_VIEW_RECT = pygame.Rect(BOARD_OFFSET_X, BOARD_OFFSET_Y, BOARD_WIDTH, BOARD_WIDTH)
+# 1マスの大きさ (ピクセル) の範囲。大きい盤の初期表示は DEFAULT_CELL_SIZE_LIMIT より小さくしない
+MIN_CELL_SIZE = 8; MAX_CELL_SIZE = 120; DEFAULT_CELL_SIZE_LIMIT = 40
+ZOOM_STEP = 1.25
 # 色
 GRID_COLOR = (100, 100, 100); BLACK = (0, 0, 0); WHITE = (255, 255, 255)
 P1_COLOR = (0, 100, 255); P2_COLOR = (255, 50, 50)
@@ -23,302 +37,346 @@ ICE_TILE_COLOR = (173, 216, 230)
 MOVE_HIGHLIGHT_COLOR = (255, 255, 0, 128); FALL_HIGHLIGHT_COLOR = (255, 0, 0, 128)
 PLACE_HIGHLIGHT_COLOR = (0, 255, 255, 128); FIGURE_BONUS_HIGHLIGHT_COLOR = (255, 215, 0, 200)
 DRILL_TARGET_HIGHLIGHT_COLOR = (255, 0, 255, 180)
-
-# --- マーカー定義 ---
-STONE_MARKER = "S"; RECOVERY_MARKER = "R"; BOMB_MARKER = "B"; ICE_MARKER = "I"; EMPTY_MARKER = " "
-
-# --- ヘルパー関数 ---
-def _manhattan_distance(pos1, pos2):
-    return abs(pos1[0] - pos2[0]) + abs(pos1[1] - pos2[1])
-
-# --- ゲーム状態を管理するクラス ---
-class GameState:
-    def __init__(self, size=BOARD_SIZE):
-        self.board = np.full((size, size), EMPTY_MARKER, dtype=object)
-        self.player_pos = {1: (size // 2, 0), 2: (size // 2, size - 1)}
-        self.player_points = {1: 0, 2: 0}
-        self.skill_costs = {'recovery': 100, 'bomb': 50, 'drill': 200, 'ice': 100}
-        self.special_skill = {1: None, 2: None}
-        self.selection_confirmed = {1: False, 2: False}
-        self.current_phase = "skill_selection"
-        self.current_turn_player = 1
-        self.dice_roll = 0
-        self.placement_type = 'stone'
-        self.movable_tiles, self.placeable_tiles, self.fall_trigger_tiles, self.drill_target_tiles = [], [], [], []
-        self.winner, self.win_reason = None, ""
-        self.figure_bonus_tiles, self.figure_bonus_timer = [], 0
-
-    def _setup_initial_board(self):
-        p1_pos, p2_pos = self.player_pos[1], self.player_pos[2]
-        p1_fountain_zone = [(r, c) for r in range(BOARD_SIZE) for c in range(BOARD_SIZE // 2 - 1)]
-        p1_valid_spots = [pos for pos in p1_fountain_zone if _manhattan_distance(p1_pos, pos) > 3]
-        p1_fountain_pos = random.choice(p1_valid_spots); self.board[p1_fountain_pos] = RECOVERY_MARKER
-        p2_fountain_zone = [(r, c) for r in range(BOARD_SIZE) for c in range(BOARD_SIZE // 2 + 2, BOARD_SIZE)]
-        p2_valid_spots = [pos for pos in p2_fountain_zone if _manhattan_distance(p2_pos, pos) > 3]
-        p2_fountain_pos = random.choice(p2_valid_spots); self.board[p2_fountain_pos] = RECOVERY_MARKER
-        dist1, dist2 = _manhattan_distance(p1_pos, p1_fountain_pos), _manhattan_distance(p2_pos, p2_fountain_pos)
-        self.current_turn_player = 1 if dist1 > dist2 else 2 if dist2 > dist1 else random.choice([1, 2])
-        banned = {p1_fountain_pos, p2_fountain_pos, p1_pos, p2_pos}
-        for r_off in [-1, 0, 1]:
-            for c_off in [-1, 0, 1]:
-                banned.add((p1_pos[0] + r_off, p1_pos[1] + c_off)); banned.add((p2_pos[0] + r_off, p2_pos[1] + c_off))
-        possible_spots = [(r, c) for r in range(BOARD_SIZE) for c in range(BOARD_SIZE) if (r, c) not in banned]
-        for pos in random.sample(possible_spots, 3): self.board[pos] = STONE_MARKER
-
-    def select_starting_skill(self, player_num, skill_type):
-        if not self.selection_confirmed[player_num]:
-            self.special_skill[player_num] = skill_type
-            self.selection_confirmed[player_num] = True
-        if all(self.selection_confirmed.values()):
-            self._setup_initial_board()
-            self.current_phase = "roll"
-
-    def find_movable_tiles(self):
-        self.movable_tiles, self.fall_trigger_tiles = [], []
-        player_r, player_c = self.player_pos[self.current_turn_player]
-        other_player_pos = self.player_pos[2 if self.current_turn_player == 1 else 1]
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            path_steps, step = self.dice_roll, 1
-            visited_ice, current_pos, final_dest = set(), (player_r, player_c), None
-            while step <= path_steps:
-                next_pos = (current_pos[0] + dr, current_pos[1] + dc)
-                if not (0 <= next_pos[0] < BOARD_SIZE and 0 <= next_pos[1] < BOARD_SIZE):
-                    if final_dest: self.fall_trigger_tiles.append(final_dest)
-                    break
-                if self.board[next_pos] == STONE_MARKER or next_pos == other_player_pos:
-                    if final_dest: self.movable_tiles.append(final_dest)
-                    break
-                final_dest, current_pos = next_pos, next_pos
-                if self.board[next_pos] == ICE_MARKER and next_pos not in visited_ice:
-                    path_steps += 1; visited_ice.add(next_pos)
-                step += 1
-            else:
-                if final_dest: self.movable_tiles.append(final_dest)
-        self.movable_tiles, self.fall_trigger_tiles = list(set(self.movable_tiles)), list(set(self.fall_trigger_tiles))
-        if not self.movable_tiles and not self.fall_trigger_tiles:
-            self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason="is blocked and cannot move!")
-
-    def move_player(self, new_r, new_c):
-        dest_type = self.board[new_r, new_c]
-        if dest_type == BOMB_MARKER:
-            self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason="stepped on a bomb!")
-            return
-        self.player_pos[self.current_turn_player] = (new_r, new_c)
-        if dest_type == RECOVERY_MARKER: self.player_points[self.current_turn_player] += 20
-        self.current_phase = "place"; self.placement_type = 'stone'
-        self.clear_highlights(); self.find_placeable_tiles()
-
-    def set_placement_type(self, p_type):
-        cost = self.skill_costs.get(p_type)
-        if cost is not None and self.player_points[self.current_turn_player] < cost: return
-        self.placement_type = p_type
-        if p_type == 'drill':
-            self.current_phase = 'drill_target'; self.find_drill_target_tiles()
-        else:
-            self.current_phase = 'place'; self.find_placeable_tiles()
-
-    def find_placeable_tiles(self):
-        self.placeable_tiles, self.drill_target_tiles = [], []
-        player_r, player_c = self.player_pos[self.current_turn_player]
-        other_player_pos = self.player_pos[2 if self.current_turn_player == 1 else 1]
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            r, c = player_r + dr, player_c + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE and (r, c) != other_player_pos:
-                if self.placement_type == 'stone':
-                    if self.board[r, c] != STONE_MARKER: self.placeable_tiles.append((r, c))
-                elif self.placement_type in ['recovery', 'bomb', 'ice']:
-                    if self.board[r, c] == EMPTY_MARKER: self.placeable_tiles.append((r, c))
-        if not self.placeable_tiles and self.winner is None:
-            self.game_over(winner=2 if self.current_turn_player == 1 else 1, reason="has no place to put an object!")
-
-    def place_object(self, r, c):
-        if self.placement_type == 'stone':
-            self.board[r, c] = STONE_MARKER
-            bonus_count, bonus_coords = self.check_figure_bonus(r, c)
-            if bonus_count > 0:
-                self.player_points[self.current_turn_player] += 10 * bonus_count
-                self.figure_bonus_tiles, self.figure_bonus_timer = bonus_coords, 90
-        else:
-            self.player_points[self.current_turn_player] -= self.skill_costs[self.placement_type]
-            marker_map = {'recovery': RECOVERY_MARKER, 'bomb': BOMB_MARKER, 'ice': ICE_MARKER}
-            self.board[r, c] = marker_map[self.placement_type]
-        self.end_turn()
-
-    def _is_shape_complete(self, tl_r, tl_c, shape_coords):
-        coords = []
-        for dr, dc in shape_coords:
-            r, c = tl_r + dr, tl_c + dc
-            if not (0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE and self.board[r, c] == STONE_MARKER): return None
-            coords.append((r, c))
-        return coords
-
-    def check_figure_bonus(self, r, c):
-        shapes = [
-            {(0,0), (1,0), (2,0), (0,1), (2,1)}, {(0,0), (2,0), (0,1), (1,1), (2,1)},
-            {(0,0), (1,0), (0,1), (0,2), (1,2)}, {(0,0), (0,2), (1,0), (1,1), (1,2)}
-        ]
-        found_shapes = set()
-        for shape in shapes:
-            for dr, dc in shape:
-                tl_r, tl_c = r - dr, c - dc
-                completed_coords = self._is_shape_complete(tl_r, tl_c, shape)
-                if completed_coords: found_shapes.add(frozenset(completed_coords))
-        if not found_shapes: return 0, []
-        all_bonus_coords = set().union(*found_shapes)
-        return len(found_shapes), list(all_bonus_coords)
-
-    def find_drill_target_tiles(self):
-        self.drill_target_tiles, self.placeable_tiles = [], []
-        player_r, player_c = self.player_pos[self.current_turn_player]
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            r, c = player_r + dr, player_c + dc
-            if 0 <= r < BOARD_SIZE and 0 <= c < BOARD_SIZE and self.board[r, c] == STONE_MARKER:
-                self.drill_target_tiles.append((r, c))
-        if not self.drill_target_tiles: print("破壊できる石がありません")
-
-    def use_drill(self, r, c):
-        self.player_points[self.current_turn_player] -= self.skill_costs['drill']
-        self.board[r, c] = EMPTY_MARKER
-        self.end_turn()
-
-    def end_turn(self):
-        self.current_turn_player = 2 if self.current_turn_player == 1 else 1
-        self.player_points[self.current_turn_player] += 10
-        self.current_phase = "roll"; self.dice_roll = 0
-        self.clear_highlights()
-
-    def clear_highlights(self):
-        self.movable_tiles, self.placeable_tiles, self.fall_trigger_tiles, self.drill_target_tiles = [], [], [], []
-
-    def game_over(self, winner, reason):
-        if self.winner is None:
-            loser = 1 if winner == 2 else 2
-            self.winner = winner; self.win_reason = f"Player {loser} {reason}"; self.current_phase = "game_over"
+# AIの1手ごとの待ち時間 (秒)
+AI_STEP_DELAY = 0.6
+# 図形ボーナスの点滅間隔 (秒) と描画の上限フレームレート
+FIGURE_BONUS_BLINK_INTERVAL = 1 / 6
+DEFAULT_MAX_FPS = 60
+# 勝率推定のバッチが終わったことを知らせるイベント (メインループを起こすだけ)
+WIN_PROBABILITY_EVENT = pygame.USEREVENT + 2
+# 計測 HUD (F3 で表示切り替え) は盤の上の帯に出す。値は直近 PROFILE_HUD_WINDOW 回分の平均と p95
+PROFILE_HUD_RECT = pygame.Rect(BOARD_OFFSET_X, 0, BOARD_WIDTH, BOARD_OFFSET_Y)
+PROFILE_HUD_WINDOW = 120
+PROFILE_HUD_SECTIONS = (('frame', 'loop.render'), ('events', 'loop.events'), ('ai', 'ai.move'))
+
+# --- カメラ ---
+# 盤面は BOARD_VIEW_RECT の中に描き、大きい盤ではその範囲だけをスクロール・拡大縮小して切り出す
+# x, y は表示領域の左上が指す盤面上のピクセル位置、cell_size が1マスの大きさ (拡大率)
+class Camera:
+    def __init__(self, board_size=BOARD_SIZE, view=BOARD_VIEW_RECT, cell_size=None):
+        self.board_size, self.view = board_size, pygame.Rect(view)
+        self.cell_size = cell_size or max(self.view.width // board_size, DEFAULT_CELL_SIZE_LIMIT)
+        self.x = self.y = 0
+
+    def _clamp(self):
+        board_pixels = self.board_size * self.cell_size
+        self.x = min(max(self.x, 0), max(0, board_pixels - self.view.width))
+        self.y = min(max(self.y, 0), max(0, board_pixels - self.view.height))
+
+    def key(self):
+        return (self.x, self.y, self.cell_size)
+
+    def cell_rect(self, r, c):
+        return pygame.Rect(self.view.x + c * self.cell_size - self.x, self.view.y + r * self.cell_size - self.y,
+                           self.cell_size, self.cell_size)
+
+    def cell_at(self, pos):
+        if not self.view.collidepoint(pos): return None
+        r, c = (pos[1] - self.view.y + self.y) // self.cell_size, (pos[0] - self.view.x + self.x) // self.cell_size
+        return (r, c) if r < self.board_size and c < self.board_size else None
+
+    # 表示領域に一部でもかかるマスの範囲 (行の始め, 行の終わり, 列の始め, 列の終わり)
+    def visible_cells(self):
+        size = self.cell_size
+        return (self.y // size, min(self.board_size, (self.y + self.view.height - 1) // size + 1),
+                self.x // size, min(self.board_size, (self.x + self.view.width - 1) // size + 1))
+
+    def is_visible(self, r, c):
+        r0, r1, c0, c1 = self.visible_cells()
+        return r0 <= r < r1 and c0 <= c < c1
+
+    def scroll(self, dx, dy):
+        self.x += dx; self.y += dy; self._clamp()
+
+    # anchor (画面座標) の下にある盤面上の点を動かさずに拡大縮小する
+    def zoom(self, factor, anchor=None):
+        anchor = anchor if anchor and self.view.collidepoint(anchor) else self.view.center
+        new_size = min(MAX_CELL_SIZE, max(MIN_CELL_SIZE, round(self.cell_size * factor)))
+        if new_size == self.cell_size: return
+        ax, ay = anchor[0] - self.view.x, anchor[1] - self.view.y
+        self.x = (self.x + ax) * new_size // self.cell_size - ax
+        self.y = (self.y + ay) * new_size // self.cell_size - ay
+        self.cell_size = new_size; self._clamp()
+
+    def center_on(self, pos):
+        self.x = pos[1] * self.cell_size + self.cell_size // 2 - self.view.width // 2
+        self.y = pos[0] * self.cell_size + self.cell_size // 2 - self.view.height // 2
+        self._clamp()
+
+    def ensure_visible(self, pos):
+        rect = self.cell_rect(*pos)
+        if not self.view.contains(rect): self.center_on(pos)
+
+# --- アイコンのキャッシュ ---
+# 標準の大きさ (CELL_SIZE から決まる) のアイコンはアトラスのサブサーフェスをそのまま使う
+# 拡大率 (1マスの大きさ) を変えたときだけ、アトラスから縮小し直した1枚の帯を作ってそのサブサーフェスを保持する
+class IconCache:
+    def __init__(self, atlas, max_sizes=8):
+        self.atlas, self.max_sizes = atlas, max_sizes
+        self.scaled = OrderedDict()
+
+    def for_size(self, cell_size):
+        icon_size = max(1, int(cell_size * 0.8))
+        if icon_size == self.atlas.icon_size: return self.atlas.icons()
+        icons = self.scaled.get(icon_size)
+        if icons is not None:
+            self.scaled.move_to_end(icon_size); return icons
+        sources = self.atlas.icons()
+        strip = pygame.Surface((icon_size * len(sources), icon_size), pygame.SRCALPHA)
+        icons = {}
+        for index, (name, image) in enumerate(sources.items()):
+            strip.blit(pygame.transform.scale(image, (icon_size, icon_size)), (index * icon_size, 0),
+                       special_flags=pygame.BLEND_RGBA_ADD)
+            icons[name] = strip.subsurface((index * icon_size, 0, icon_size, icon_size))
+        self.scaled[icon_size] = icons
+        if len(self.scaled) > self.max_sizes: self.scaled.popitem(last=False)
+        return icons
 
 # --- 描画関連の関数 ---
-def draw_board(screen, game_state, icon_images):
-    move_highlight_surf = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA); move_highlight_surf.fill(MOVE_HIGHLIGHT_COLOR)
-    fall_highlight_surf = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA); fall_highlight_surf.fill(FALL_HIGHLIGHT_COLOR)
-    place_highlight_surf = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA); place_highlight_surf.fill(PLACE_HIGHLIGHT_COLOR)
-    bonus_highlight_surf = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA); bonus_highlight_surf.fill(FIGURE_BONUS_HIGHLIGHT_COLOR)
-    drill_highlight_surf = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA); drill_highlight_surf.fill(DRILL_TARGET_HIGHLIGHT_COLOR)
-
-    for r in range(BOARD_SIZE):
-        for c in range(BOARD_SIZE):
-            rect = pygame.Rect(c * CELL_SIZE + BOARD_OFFSET_X, r * CELL_SIZE + BOARD_OFFSET_Y, CELL_SIZE, CELL_SIZE)
-            pygame.draw.rect(screen, WHITE, rect)
-            tile_type = game_state.board[r, c]
-            icon_to_draw = None
-            if tile_type == RECOVERY_MARKER:
-                pygame.draw.rect(screen, RECOVERY_TILE_COLOR, rect); icon_to_draw = icon_images['recovery']
-            elif tile_type == BOMB_MARKER:
-                pygame.draw.rect(screen, BOMB_TILE_COLOR, rect); icon_to_draw = icon_images['bomb']
-            elif tile_type == STONE_MARKER:
-                icon_to_draw = icon_images['stone']
-            elif tile_type == ICE_MARKER:
-                pygame.draw.rect(screen, ICE_TILE_COLOR, rect); icon_to_draw = icon_images['ice']
-            pygame.draw.rect(screen, GRID_COLOR, rect, 1)
-            if icon_to_draw:
-                screen.blit(icon_to_draw, icon_to_draw.get_rect(center=rect.center))
-
-    for r, c in game_state.movable_tiles:
-         screen.blit(move_highlight_surf, (c * CELL_SIZE + BOARD_OFFSET_X, r * CELL_SIZE + BOARD_OFFSET_Y))
-    for r, c in game_state.fall_trigger_tiles:
-        screen.blit(fall_highlight_surf, (c * CELL_SIZE + BOARD_OFFSET_X, r * CELL_SIZE + BOARD_OFFSET_Y))
-    if game_state.current_phase == 'place':
-        for r, c in game_state.placeable_tiles:
-            screen.blit(place_highlight_surf, (c * CELL_SIZE + BOARD_OFFSET_X, r * CELL_SIZE + BOARD_OFFSET_Y))
-    if game_state.current_phase == 'drill_target':
-        for r, c in game_state.drill_target_tiles:
-            screen.blit(drill_highlight_surf, (c * CELL_SIZE + BOARD_OFFSET_X, r * CELL_SIZE + BOARD_OFFSET_Y))
-    
-    if game_state.figure_bonus_timer > 0 and (game_state.figure_bonus_timer // 10) % 2 == 0:
-        for r, c in game_state.figure_bonus_tiles:
-            screen.blit(bonus_highlight_surf, (c * CELL_SIZE + BOARD_OFFSET_X, r * CELL_SIZE + BOARD_OFFSET_Y))
-
-    for player_num, pos in game_state.player_pos.items():
-        r, c = pos
-        center = (c * CELL_SIZE + BOARD_OFFSET_X + CELL_SIZE // 2, r * CELL_SIZE + BOARD_OFFSET_Y + CELL_SIZE // 2)
-        color = P1_COLOR if player_num == 1 else P2_COLOR
-        pygame.draw.circle(screen, color, center, CELL_SIZE // 2 - 10)
-
-def draw_player_panels(screen, game_state, fonts, button_rects):
+_highlight_surfaces = {}
+def get_highlight_surfaces(cell_size=CELL_SIZE):
+    if cell_size not in _highlight_surfaces:
+        surfaces = _highlight_surfaces[cell_size] = {}
+        for kind, color in [('move', MOVE_HIGHLIGHT_COLOR), ('fall', FALL_HIGHLIGHT_COLOR), ('place', PLACE_HIGHLIGHT_COLOR),
+                            ('drill', DRILL_TARGET_HIGHLIGHT_COLOR), ('bonus', FIGURE_BONUS_HIGHLIGHT_COLOR)]:
+            surfaces[kind] = pygame.Surface((cell_size, cell_size), pygame.SRCALPHA); surfaces[kind].fill(color)
+    return _highlight_surfaces[cell_size]
+
+def draw_cell_tile(surface, rect, tile_type, icon_images):
+    pygame.draw.rect(surface, WHITE, rect)
+    icon_to_draw = None
+    if tile_type == RECOVERY_CELL:
+        pygame.draw.rect(surface, RECOVERY_TILE_COLOR, rect); icon_to_draw = icon_images['recovery']
+    elif tile_type == BOMB_CELL:
+        pygame.draw.rect(surface, BOMB_TILE_COLOR, rect); icon_to_draw = icon_images['bomb']
+    elif tile_type == STONE_CELL:
+        icon_to_draw = icon_images['stone']
+    elif tile_type == ICE_CELL:
+        pygame.draw.rect(surface, ICE_TILE_COLOR, rect); icon_to_draw = icon_images['ice']
+    pygame.draw.rect(surface, GRID_COLOR, rect, 1)
+    if icon_to_draw:
+        surface.blit(icon_to_draw, icon_to_draw.get_rect(center=rect.center))
+
+# マスの上に重ねるもの (ハイライトとプレイヤー) を描画順に返す
+def cell_decorations(game_state):
+    decorations = [('move', pos) for pos in game_state.movable_tiles] + [('fall', pos) for pos in game_state.fall_trigger_tiles]
+    if game_state.current_phase == 'place': decorations += [('place', pos) for pos in game_state.placeable_tiles]
+    if game_state.current_phase == 'drill_target': decorations += [('drill', pos) for pos in game_state.drill_target_tiles]
+    if figure_bonus_visible(game_state.figure_bonus_timer):
+        decorations += [('bonus', pos) for pos in game_state.figure_bonus_tiles]
+    decorations += [(player_num, pos) for player_num, pos in game_state.player_pos.items()]
+    return decorations
+
+def draw_decoration(screen, kind, r, c, camera):
+    rect = camera.cell_rect(r, c)
+    if kind in (1, 2):
+        radius = max(camera.cell_size // 2 - 10, camera.cell_size // 3)
+        pygame.draw.circle(screen, P1_COLOR if kind == 1 else P2_COLOR, rect.center, radius)
+    else:
+        screen.blit(get_highlight_surfaces(camera.cell_size)[kind], rect.topleft)
+
+# カメラに映るマスだけを描く (盤の大きさによらず、描く量は表示領域の広さで決まる)
+def draw_board(screen, game_state, icon_images, camera=None):
+    camera = camera or Camera(game_state.size)
+    icons, clip = icon_images.for_size(camera.cell_size), screen.get_clip()
+    screen.set_clip(camera.view)
+    r0, r1, c0, c1 = camera.visible_cells()
+    for r in range(r0, r1):
+        for c in range(c0, c1):
+            draw_cell_tile(screen, camera.cell_rect(r, c), game_state.board[r, c], icons)
+    for kind, (r, c) in cell_decorations(game_state):
+        if r0 <= r < r1 and c0 <= c < c1: draw_decoration(screen, kind, r, c, camera)
+    screen.set_clip(clip)
+
+# --- 差分描画 ---
+# 表示領域に映るマスのタイルとアイコンは layer に描き溜め、GameState の盤面と食い違ったマスだけ描き直す
+# カメラが動いたら layer を映る範囲で描き直す。画面へは前フレームから見た目が変わったマスだけを転送し、その矩形を返す
+class BoardRenderer:
+    def __init__(self, icon_images, camera=None):
+        self.icon_images, self.camera = icon_images, camera or Camera()
+        self.layer = pygame.Surface(self.camera.view.size)
+        self.layer_key, self.layer_cells = None, None
+        self.cell_looks = None
+
+    def invalidate(self):
+        self.cell_looks = None
+
+    def _layer_rect(self, r, c):
+        return self.camera.cell_rect(r, c).move(-self.camera.view.x, -self.camera.view.y)
+
+    def _sync_layer(self, board):
+        camera = self.camera
+        r0, r1, c0, c1 = camera.visible_cells()
+        if self.layer_key != (camera.key(), board.shape):
+            self.layer_key = (camera.key(), board.shape)
+            self.layer.fill(BLACK); self.cell_looks = None
+            self.layer_cells = np.full((r1 - r0, c1 - c0), -1, dtype=board.dtype)
+        window = board[r0:r1, c0:c1]
+        changed = [(r0 + int(r), c0 + int(c)) for r, c in np.argwhere(self.layer_cells != window)]
+        icons = self.icon_images.for_size(camera.cell_size)
+        for r, c in changed:
+            draw_cell_tile(self.layer, self._layer_rect(r, c), board[r, c], icons)
+            self.layer_cells[r - r0, c - c0] = board[r, c]
+        return changed
+
+    def draw(self, screen, game_state):
+        camera = self.camera
+        changed = self._sync_layer(game_state.board)
+        looks = {}
+        for kind, pos in cell_decorations(game_state):
+            if camera.is_visible(*pos): looks.setdefault(pos, []).append(kind)
+        clip = screen.get_clip(); screen.set_clip(camera.view)
+        if self.cell_looks is None:
+            screen.blit(self.layer, camera.view)
+            for (r, c), kinds in looks.items():
+                for kind in kinds: draw_decoration(screen, kind, r, c, camera)
+            dirty_rects = [camera.view.copy()]
+        else:
+            dirty_cells = set(changed)
+            dirty_cells.update(pos for pos in looks.keys() | self.cell_looks.keys() if looks.get(pos) != self.cell_looks.get(pos))
+            dirty_rects = []
+            for r, c in dirty_cells:
+                area = self._layer_rect(r, c).clip(self.layer.get_rect())
+                screen.blit(self.layer, (area.x + camera.view.x, area.y + camera.view.y), area)
+                for kind in looks.get((r, c), ()): draw_decoration(screen, kind, r, c, camera)
+                dirty_rects.append(area.move(camera.view.x, camera.view.y))
+        screen.set_clip(clip)
+        self.cell_looks = looks
+        return dirty_rects
+
+# パネルの見た目を決める値 (変わったときだけパネルを描き直す)
+# win_probability は WinProbabilityEstimator.estimate() の (P1 の勝率, 試行数)。表示は % 単位なのでその精度で比べる
+def panel_state_key(game_state, win_probability=None):
+    return (round(win_probability[0] * 100) if win_probability else None,
+            game_state.current_phase, tuple(game_state.selection_confirmed.values()), game_state.current_turn_player,
+            game_state.winner, tuple(game_state.player_points.values()), game_state.dice_roll, game_state.placement_type,
+            tuple(game_state.skill_costs.values()), tuple(game_state.special_skill.values()), game_state.can_undo())
+
+# 画面全体の差分描画。パネルは見た目を決める値が変わったときだけ描き直す
+# ゲームオーバー画面は半透明で重ねるので、その間に変化があれば全体を描き直す
+class FrameRenderer:
+    def __init__(self, icon_images, camera=None):
+        self.board_renderer = BoardRenderer(icon_images, camera)
+        self.panel_rects = [pygame.Rect(0, 0, PANEL_WIDTH, SCREEN_HEIGHT),
+                            pygame.Rect(SCREEN_WIDTH - PANEL_WIDTH, 0, PANEL_WIDTH, SCREEN_HEIGHT)]
+        self.panel_key, self.full_redraw = None, True
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def _draw(self, screen, game_state, fonts, button_rects, win_probability):
+        dirty_rects = []
+        if self.full_redraw:
+            screen.fill(BLACK); self.board_renderer.invalidate(); self.panel_key = None
+        panel_key = panel_state_key(game_state, win_probability)
+        if panel_key != self.panel_key:
+            draw_player_panels(screen, game_state, fonts, button_rects, win_probability=win_probability)
+            self.panel_key = panel_key; dirty_rects += self.panel_rects
+        return dirty_rects + self.board_renderer.draw(screen, game_state)
+
+    def render(self, screen, game_state, fonts, button_rects, win_probability=None):
+        dirty_rects = self._draw(screen, game_state, fonts, button_rects, win_probability)
+        if game_state.winner is not None and dirty_rects:
+            if not self.full_redraw:
+                self.full_redraw = True; self._draw(screen, game_state, fonts, button_rects, win_probability)
+            draw_game_over_screen(screen, game_state, fonts); dirty_rects = [screen.get_rect()]
+        self.full_redraw = False
+        return dirty_rects
+
+# --- テキスト・ボタンのキャッシュ ---
+# font.render の結果と合成済みボタンを (フォント, 文字列, 色...) をキーに保持し、古いものから捨てる (LRU)
+# 値が変わればキーも変わるので、描き直しが起きるのは表示内容が変わったときだけ
+class RenderCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits, self.misses = 0, 0
+
+    def get(self, key, build):
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key); self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.entries[key] = build()
+        if len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+        return surface
+
+    def text(self, font, text, color):
+        return self.get(('text', font, text, color), lambda: font.render(text, True, color))
+
+    # labels は (フォント, 文字列, 色, 位置) の並び。位置が None なら中央寄せ
+    def button(self, size, bg_color, border_width, labels):
+        def build():
+            surface = pygame.Surface(size)
+            rect = surface.get_rect()
+            pygame.draw.rect(surface, bg_color, rect)
+            if border_width: pygame.draw.rect(surface, WHITE, rect, border_width)
+            for font, text, color, pos in labels:
+                text_surf = self.text(font, text, color)
+                surface.blit(text_surf, text_surf.get_rect(center=rect.center) if pos is None else pos)
+            return surface
+        return self.get(('button', size, bg_color, border_width, tuple(labels)), build)
+
+panel_cache = RenderCache()
+
+def draw_player_panels(screen, game_state, fonts, button_rects, cache=panel_cache, win_probability=None):
     p1_panel_rect = pygame.Rect(0, 0, PANEL_WIDTH, SCREEN_HEIGHT)
     p2_panel_rect = pygame.Rect(SCREEN_WIDTH - PANEL_WIDTH, 0, PANEL_WIDTH, SCREEN_HEIGHT)
     pygame.draw.rect(screen, P1_PANEL_BG, p1_panel_rect)
     pygame.draw.rect(screen, P2_PANEL_BG, p2_panel_rect)
 
+    def draw_button(key, bg_color, selected, font_name, label, label_color, panel_x):
+        btn = button_rects[key].move(panel_x, 0)
+        screen.blit(cache.button(btn.size, bg_color, 4 if selected else 0, [(fonts[font_name], label, label_color, None)]), btn)
+
     for player_num in [1, 2]:
         panel_rect = p1_panel_rect if player_num == 1 else p2_panel_rect
         text_color = WHITE
         
         if game_state.current_phase == "skill_selection":
+            screen.blit(cache.text(fonts['large'], f"Player {player_num}", text_color), (panel_rect.x + 20, 50))
             if not game_state.selection_confirmed[player_num]:
-                title_surf = fonts['large'].render(f"Player {player_num}", True, text_color)
-                screen.blit(title_surf, (panel_rect.x + 20, 50))
-                subtitle_surf = fonts['medium'].render("Choose Special Skill", True, text_color)
-                screen.blit(subtitle_surf, (panel_rect.x + 20, 120))
-                
+                screen.blit(cache.text(fonts['medium'], "Choose Special Skill", text_color), (panel_rect.x + 20, 120))
                 btn1 = button_rects['start_skill_1'].move(panel_rect.x, 0)
-                pygame.draw.rect(screen, ICE_TILE_COLOR, btn1); pygame.draw.rect(screen, WHITE, btn1, 3)
-                title1 = fonts['medium'].render("Ice Skill", True, BLACK); desc1 = fonts['small'].render("Place ice tiles", True, BLACK)
-                screen.blit(title1, (btn1.x + 20, btn1.y + 20)); screen.blit(desc1, (btn1.x + 20, btn1.y + 60))
+                screen.blit(cache.button(btn1.size, ICE_TILE_COLOR, 3, [(fonts['medium'], "Ice Skill", BLACK, (20, 20)),
+                                                                       (fonts['small'], "Place ice tiles", BLACK, (20, 60))]), btn1)
             else:
-                title_surf = fonts['large'].render(f"Player {player_num}", True, text_color)
-                screen.blit(title_surf, (panel_rect.x + 20, 50))
-                ready_surf = fonts['large'].render("Ready!", True, (0, 255, 0))
-                screen.blit(ready_surf, (panel_rect.x + 20, 250))
+                screen.blit(cache.text(fonts['large'], "Ready!", (0, 255, 0)), (panel_rect.x + 20, 250))
             continue
 
         is_turn = game_state.current_turn_player == player_num
-        name_surf = fonts['large'].render(f"Player {player_num}{' (Turn)' if is_turn and game_state.winner is None else ''}", True, text_color)
-        screen.blit(name_surf, (panel_rect.x + 20, 50))
-        
-        points_surf = fonts['medium'].render(f"Points: {game_state.player_points[player_num]}", True, text_color)
-        screen.blit(points_surf, (panel_rect.x + 20, 120))
+        name = f"Player {player_num}{' (Turn)' if is_turn and game_state.winner is None else ''}"
+        screen.blit(cache.text(fonts['large'], name, text_color), (panel_rect.x + 20, 50))
+        screen.blit(cache.text(fonts['medium'], f"Points: {game_state.player_points[player_num]}", text_color), (panel_rect.x + 20, 120))
+        if win_probability and game_state.winner is None:
+            p1_rate = win_probability[0]
+            rate = p1_rate if player_num == 1 else 1.0 - p1_rate
+            screen.blit(cache.text(fonts['medium'], f"Win: {round(rate * 100)}%", (180, 220, 255)), (panel_rect.x + 20, 170))
         
         if is_turn and game_state.dice_roll > 0:
-            dice_surf = fonts['medium'].render(f"Dice Roll: {game_state.dice_roll}", True, (255, 255, 0))
-            screen.blit(dice_surf, (panel_rect.x + 20, 240))
+            screen.blit(cache.text(fonts['medium'], f"Dice Roll: {game_state.dice_roll}", (255, 255, 0)), (panel_rect.x + 20, 240))
 
         if is_turn:
             if game_state.current_phase == 'roll':
-                btn = button_rects['roll'].move(panel_rect.x, 0)
-                pygame.draw.rect(screen, (0, 200, 0), btn)
-                text = fonts['medium'].render("Roll Dice", True, WHITE)
-                screen.blit(text, text.get_rect(center=btn.center))
+                draw_button('roll', (0, 200, 0), False, 'medium', "Roll Dice", WHITE, panel_rect.x)
             
             elif game_state.current_phase in ['place', 'drill_target']:
-                btn_stone = button_rects['place_stone'].move(panel_rect.x, 0)
-                pygame.draw.rect(screen, STONE_COLOR, btn_stone)
-                if game_state.placement_type == 'stone' and game_state.current_phase == 'place': pygame.draw.rect(screen, WHITE, btn_stone, 4)
-                text_stone = fonts['medium'].render("Place Stone", True, WHITE)
-                screen.blit(text_stone, text_stone.get_rect(center=btn_stone.center))
-                
-                btn_rec = button_rects['place_recovery'].move(panel_rect.x, 0)
-                pygame.draw.rect(screen, RECOVERY_TILE_COLOR, btn_rec)
-                if game_state.placement_type == 'recovery': pygame.draw.rect(screen, WHITE, btn_rec, 4)
-                text_rec = fonts['small'].render(f"Recovery ({game_state.skill_costs['recovery']}pt)", True, BLACK)
-                screen.blit(text_rec, text_rec.get_rect(center=btn_rec.center))
-
-                btn_bomb = button_rects['place_bomb'].move(panel_rect.x, 0)
-                pygame.draw.rect(screen, BOMB_TILE_COLOR, btn_bomb)
-                if game_state.placement_type == 'bomb': pygame.draw.rect(screen, WHITE, btn_bomb, 4)
-                text_bomb = fonts['small'].render(f"Bomb ({game_state.skill_costs['bomb']}pt)", True, BLACK)
-                screen.blit(text_bomb, text_bomb.get_rect(center=btn_bomb.center))
-
-                btn_drill = button_rects['use_drill'].move(panel_rect.x, 0)
-                pygame.draw.rect(screen, DRILL_COLOR, btn_drill)
-                if game_state.current_phase == 'drill_target': pygame.draw.rect(screen, WHITE, btn_drill, 4)
-                text_drill = fonts['small'].render(f"Drill ({game_state.skill_costs['drill']}pt)", True, WHITE)
-                screen.blit(text_drill, text_drill.get_rect(center=btn_drill.center))
-                
+                costs = game_state.skill_costs
+                draw_button('place_stone', STONE_COLOR, game_state.placement_type == 'stone' and game_state.current_phase == 'place',
+                            'medium', "Place Stone", WHITE, panel_rect.x)
+                draw_button('place_recovery', RECOVERY_TILE_COLOR, game_state.placement_type == 'recovery',
+                            'small', f"Recovery ({costs['recovery']}pt)", BLACK, panel_rect.x)
+                draw_button('place_bomb', BOMB_TILE_COLOR, game_state.placement_type == 'bomb',
+                            'small', f"Bomb ({costs['bomb']}pt)", BLACK, panel_rect.x)
+                draw_button('use_drill', DRILL_COLOR, game_state.current_phase == 'drill_target',
+                            'small', f"Drill ({costs['drill']}pt)", WHITE, panel_rect.x)
                 if game_state.special_skill[player_num] == 'ice_skill':
-                    btn_ice = button_rects['place_ice'].move(panel_rect.x, 0)
-                    pygame.draw.rect(screen, ICE_TILE_COLOR, btn_ice)
-                    if game_state.placement_type == 'ice': pygame.draw.rect(screen, WHITE, btn_ice, 4)
-                    text_ice = fonts['small'].render(f"Ice ({game_state.skill_costs['ice']}pt)", True, BLACK)
-                    screen.blit(text_ice, text_ice.get_rect(center=btn_ice.center))
+                    draw_button('place_ice', ICE_TILE_COLOR, game_state.placement_type == 'ice',
+                                'small', f"Ice ({costs['ice']}pt)", BLACK, panel_rect.x)
+
+            if game_state.can_undo() and game_state.winner is None:
+                draw_button('undo', GRID_COLOR, False, 'medium', "Undo", WHITE, panel_rect.x)
 
 def draw_game_over_screen(screen, game_state, fonts):
     overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA); overlay.fill((0, 0, 0, 180))
@@ -333,28 +391,12 @@ def draw_game_over_screen(screen, game_state, fonts):
     screen.blit(btn_text, btn_text.get_rect(center=restart_button_rect.center))
     return restart_button_rect
 
-# --- メイン処理 ---
-def main():
-    pygame.init()
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-    pygame.display.set_caption("2人対戦ターン制ストラテジーゲーム")
-    clock = pygame.time.Clock()
-    
-    fonts = { 'small': pygame.font.Font(None, 32), 'medium': pygame.font.Font(None, 40), 'large': pygame.font.Font(None, 50) }
-    
-    try:
-        icon_size = int(CELL_SIZE * 0.8)
-        icon_images = {
-            'stone': pygame.transform.scale(pygame.image.load('stone.png').convert_alpha(), (icon_size, icon_size)),
-            'recovery': pygame.transform.scale(pygame.image.load('recovery.png').convert_alpha(), (icon_size, icon_size)),
-            'bomb': pygame.transform.scale(pygame.image.load('bomb.png').convert_alpha(), (icon_size, icon_size)),
-            'ice': pygame.transform.scale(pygame.image.load('ice.png').convert_alpha(), (icon_size, icon_size)),
-        }
-    except pygame.error as e:
-        print(f"画像の読み込みに失敗しました: {e}"); pygame.quit(); sys.exit()
-
-    game_state = GameState()
-    
+# --- 入力 ---
+# アイコンは最初に描くときにアトラス (無い・古ければ元画像から作る) から読み込む。画像が無ければ代用アイコンになる
+def load_icon_images(directory='.'):
+    return IconCache(IconAtlas(directory, icon_size=int(CELL_SIZE * 0.8)))
+
+def make_button_rects():
     button_rects = {
         'start_skill_1': pygame.Rect(20, 250, PANEL_WIDTH - 40, 120),
         'roll': pygame.Rect(40, 300, 200, 60),
@@ -363,88 +405,267 @@ def main():
         'place_bomb': pygame.Rect(40, 420, 200, 50),
         'use_drill': pygame.Rect(40, 480, 200, 50),
         'place_ice': pygame.Rect(40, 540, 200, 50),
+        'undo': pygame.Rect(40, 700, 200, 50),
         'restart': pygame.Rect(0, 0, 200, 50)
     }
     button_rects['restart'].center = (SCREEN_WIDTH / 2, SCREEN_HEIGHT / 2 + 50)
-
+    return button_rects
+
+# クリック位置を GameState.perform の操作タプル (または ('undo',) / ('restart',)) に変換する
+# players は操作できるプレイヤー番号 (AI やネットワーク越しの相手の手番では何も返さない)
+def click_to_action(game_state, pos, button_rects, players=(1, 2), camera=None):
+    if game_state.current_phase == "skill_selection":
+        for player_num in players:
+            panel_offset = 0 if player_num == 1 else SCREEN_WIDTH - PANEL_WIDTH
+            if not game_state.selection_confirmed[player_num] and button_rects['start_skill_1'].move(panel_offset, 0).collidepoint(pos):
+                return ('skill', player_num, 'ice_skill')
+        return None
+    if game_state.current_phase == "game_over":
+        return ('restart',) if button_rects['restart'].collidepoint(pos) else None
+    if game_state.current_turn_player not in players: return None
+
+    active_panel_offset = 0 if game_state.current_turn_player == 1 else (SCREEN_WIDTH - PANEL_WIDTH)
+    clicked = (camera or Camera(game_state.size)).cell_at(pos)
+    if game_state.can_undo() and button_rects['undo'].move(active_panel_offset, 0).collidepoint(pos):
+        return ('undo',)
+    if game_state.current_phase == "roll":
+        return ('roll',) if button_rects['roll'].move(active_panel_offset, 0).collidepoint(pos) else None
+    if game_state.current_phase == "move":
+        return ('move',) + clicked if clicked in game_state.fall_trigger_tiles or clicked in game_state.movable_tiles else None
+    if game_state.current_phase in ['place', 'drill_target']:
+        for key, p_type in [('place_stone', 'stone'), ('place_recovery', 'recovery'), ('place_bomb', 'bomb'), ('use_drill', 'drill')]:
+            if button_rects[key].move(active_panel_offset, 0).collidepoint(pos): return ('placement', p_type)
+        if game_state.special_skill[game_state.current_turn_player] == 'ice_skill' and \
+                button_rects['place_ice'].move(active_panel_offset, 0).collidepoint(pos):
+            return ('placement', 'ice')
+        if game_state.current_phase == 'drill_target' and clicked in game_state.drill_target_tiles: return ('drill',) + clicked
+        if game_state.current_phase == 'place' and clicked in game_state.placeable_tiles: return ('place',) + clicked
+    return None
+
+# --- AI操作 ---
+# ダイスを振る → 1ターン分の行動を適用、の2段階で進めて人間にも経過が見えるようにする
+def run_ai_step(game_state, ai_player):
+    if game_state.current_phase == "roll":
+        game_state.roll_dice()
+    elif game_state.current_phase == "move":
+        game_state.push_undo(); game_state.play_turn(ai_player.choose_turn(game_state))
+
+# 直前の人間の操作まで戻す (AIの手番はまとめて取り消す)
+def undo_last_action(game_state, ai_players):
+    game_state.undo()
+    while game_state.current_turn_player in ai_players and game_state.can_undo(): game_state.undo()
+
+# --- アニメーションとイベント待ち ---
+# 図形ボーナスの点滅は経過時間で進めるので、フレームレートが落ちても長さは変わらない
+def figure_bonus_visible(timer):
+    return timer > 0 and int(timer / FIGURE_BONUS_BLINK_INTERVAL) % 2 == 0
+
+def advance_figure_bonus(game_state, elapsed):
+    if game_state.figure_bonus_timer > 0:
+        game_state.figure_bonus_timer = max(0.0, game_state.figure_bonus_timer - elapsed)
+        if game_state.figure_bonus_timer == 0:
+            game_state.figure_bonus_tiles = []
+
+# 点滅の表示/非表示が次に切り替わるまでの秒数 (点滅していなければ None)
+def next_figure_bonus_change(game_state):
+    timer = game_state.figure_bonus_timer
+    if timer <= 0: return None
+    return min(timer, timer % FIGURE_BONUS_BLINK_INTERVAL or FIGURE_BONUS_BLINK_INTERVAL)
+
+# timeout 秒までイベントを待つ (None なら何か起きるまで眠る)
+def wait_for_events(timeout):
+    first = pygame.event.wait() if timeout is None else pygame.event.wait(max(1, int(timeout * 1000)))
+    return ([first] if first.type != pygame.NOEVENT else []) + pygame.event.get()
+
+# --- 棋譜 ---
+# 対局ごとにシードを引いて GameState を作り、ターンを記録する
+def new_game(seed_rng, size=BOARD_SIZE, opening_book=None):
+    game_state = GameState(size, seed=seed_rng.getrandbits(63), opening_book=opening_book)
+    game_state.record_turns()
+    return game_state
+
+# 棋譜を1ターンずつ再生する (← → で1ターン、PageUp/PageDown で10ターン、Home/End で最初と最後へ)
+def view_replay(replay):
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    fonts = { 'small': pygame.font.Font(None, 32), 'medium': pygame.font.Font(None, 40), 'large': pygame.font.Font(None, 50) }
+    button_rects = make_button_rects()
+    camera = Camera(replay.size)
+    frame_renderer = FrameRenderer(load_icon_images(), camera)
+    steps = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_PAGEUP: -10, pygame.K_PAGEDOWN: 10,
+             pygame.K_HOME: -len(replay.turns), pygame.K_END: len(replay.turns)}
+    turn, shown_turn = 0, None
     while True:
-        if game_state.figure_bonus_timer > 0:
-            game_state.figure_bonus_timer -= 1
-            if game_state.figure_bonus_timer == 0:
-                game_state.figure_bonus_tiles = []
-
-        for event in pygame.event.get():
+        if turn != shown_turn:
+            game_state, shown_turn = replay.state_at(turn), turn
+            pygame.display.set_caption(f"棋譜再生 ターン {turn}/{len(replay.turns)} (シード {replay.seed})")
+        dirty_rects = frame_renderer.render(screen, game_state, fonts, button_rects)
+        if dirty_rects: pygame.display.update(dirty_rects)
+        for event in wait_for_events(None):
             if event.type == pygame.QUIT:
                 pygame.quit(); sys.exit()
-            
-            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                pos = pygame.mouse.get_pos()
-                
-                if game_state.current_phase == "skill_selection":
-                    if not game_state.selection_confirmed[1]:
-                        if button_rects['start_skill_1'].collidepoint(pos): game_state.select_starting_skill(1, 'ice_skill')
-                    if not game_state.selection_confirmed[2]:
-                        btn1_p2 = button_rects['start_skill_1'].move(SCREEN_WIDTH - PANEL_WIDTH, 0)
-                        if btn1_p2.collidepoint(pos): game_state.select_starting_skill(2, 'ice_skill')
-                
-                elif game_state.current_phase == "game_over":
-                    if button_rects['restart'].collidepoint(pos): game_state = GameState()
-                
-                else:
-                    active_panel_offset = 0 if game_state.current_turn_player == 1 else (SCREEN_WIDTH - PANEL_WIDTH)
-                    
-                    if game_state.current_phase == "roll":
-                        if button_rects['roll'].move(active_panel_offset, 0).collidepoint(pos):
-                            game_state.dice_roll = random.randint(1, 3); game_state.find_movable_tiles()
-                            if game_state.winner is None: game_state.current_phase = "move"
-                    
-                    elif game_state.current_phase == "move":
-                        clicked_col = (pos[0] - BOARD_OFFSET_X) // CELL_SIZE; clicked_row = (pos[1] - BOARD_OFFSET_Y) // CELL_SIZE
-                        if (clicked_row, clicked_col) in game_state.fall_trigger_tiles:
-                            game_state.game_over(winner=2 if game_state.current_turn_player == 1 else 1, reason="fell off the cliff!")
-                        elif (clicked_row, clicked_col) in game_state.movable_tiles:
-                            game_state.move_player(clicked_row, clicked_col)
-                    
-                    elif game_state.current_phase in ['place', 'drill_target']:
-                        btn_stone = button_rects['place_stone'].move(active_panel_offset, 0)
-                        btn_rec = button_rects['place_recovery'].move(active_panel_offset, 0)
-                        btn_bomb = button_rects['place_bomb'].move(active_panel_offset, 0)
-                        btn_drill = button_rects['use_drill'].move(active_panel_offset, 0)
-                        btn_ice = button_rects['place_ice'].move(active_panel_offset, 0)
-                        
-                        if btn_stone.collidepoint(pos): game_state.set_placement_type('stone')
-                        elif btn_rec.collidepoint(pos): game_state.set_placement_type('recovery')
-                        elif btn_bomb.collidepoint(pos): game_state.set_placement_type('bomb')
-                        elif btn_drill.collidepoint(pos): game_state.set_placement_type('drill')
-                        elif game_state.special_skill[game_state.current_turn_player] == 'ice_skill' and btn_ice.collidepoint(pos):
-                            game_state.set_placement_type('ice')
-                        
-                        else:
-                            clicked_col = (pos[0] - BOARD_OFFSET_X) // CELL_SIZE
-                            clicked_row = (pos[1] - BOARD_OFFSET_Y) // CELL_SIZE
-                            if game_state.current_phase == 'drill_target':
-                                if (clicked_row, clicked_col) in game_state.drill_target_tiles:
-                                    game_state.use_drill(clicked_row, clicked_col)
-                            elif game_state.current_phase == 'place':
-                                if (0 <= clicked_col < BOARD_SIZE and 0 <= clicked_row < BOARD_SIZE) and \
-                                     (clicked_row, clicked_col) in game_state.placeable_tiles:
-                                    game_state.place_object(clicked_row, clicked_col)
-
-        screen.fill(BLACK)
-        
+            if event.type == pygame.KEYDOWN and event.key in steps:
+                turn = max(0, min(len(replay.turns), turn + steps[event.key]))
+            handle_camera_event(camera, event, game_state)
+
+# --- 計測 HUD ---
+def profile_hud_text(profiler):
+    parts = []
+    for label, name in PROFILE_HUD_SECTIONS:
+        buffer = profiler.buffers.get(name)
+        if buffer is None or not buffer.count: continue
+        recent = buffer.recent()[-PROFILE_HUD_WINDOW:] * 1000.0
+        parts.append(f"{label} {recent.mean():.1f}ms (p95 {np.percentile(recent, 95):.1f})")
+    return "   ".join(parts) or "profiling..."
+
+# 値は毎回変わるので RenderCache には入れない (パネルの文字がキャッシュから追い出されるため)
+def draw_profile_hud(screen, text, fonts):
+    pygame.draw.rect(screen, BLACK, PROFILE_HUD_RECT)
+    if text:
+        text_surf = fonts['small'].render(text, True, WHITE)
+        screen.blit(text_surf, text_surf.get_rect(midleft=(PROFILE_HUD_RECT.x + 10, PROFILE_HUD_RECT.centery)))
+
+# --- カメラ操作 ---
+# ホイールでカーソル位置を中心に拡大縮小、WASD でスクロール、C で手番のプレイヤーへ寄せる
+# (棋譜再生では矢印キーをターン送りに使うので、スクロールは矢印キーにしない)
+CAMERA_SCROLL_KEYS = {pygame.K_a: (-1, 0), pygame.K_d: (1, 0), pygame.K_w: (0, -1), pygame.K_s: (0, 1)}
+
+def handle_camera_event(camera, event, game_state):
+    if event.type == pygame.MOUSEWHEEL and event.y:
+        camera.zoom(ZOOM_STEP if event.y > 0 else 1 / ZOOM_STEP, pygame.mouse.get_pos())
+    elif event.type == pygame.KEYDOWN and event.key in CAMERA_SCROLL_KEYS:
+        dx, dy = CAMERA_SCROLL_KEYS[event.key]
+        step = max(camera.cell_size, camera.view.width // 4)
+        camera.scroll(dx * step, dy * step)
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+        camera.center_on(game_state.player_pos[game_state.current_turn_player])
+
+# --- メイン処理 ---
+# profiler を渡すと GameState のメソッドとメインループの各段階の時間をリングバッファに記録する
+# (F3 で HUD を切り替え、終了時に profile_path があれば集計を JSON で書き出す)
+def main(ai_players=None, max_fps=DEFAULT_MAX_FPS, seed=None, record_path=None, win_probability_workers=0,
+         board_size=BOARD_SIZE, profiler=None, profile_path=None, opening_book=None):
+    ai_players = ai_players or {}
+    timed = profiler.section if profiler else lambda name: nullcontext()
+    seed_rng = random.Random(seed)
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("2人対戦ターン制ストラテジーゲーム")
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    
+    fonts = { 'small': pygame.font.Font(None, 32), 'medium': pygame.font.Font(None, 40), 'large': pygame.font.Font(None, 50) }
+    
+    icon_images = load_icon_images()
+    game_state = new_game(seed_rng, board_size, opening_book)
+    # 計測するのは画面の対局だけ (リスタートで作り直したら付け替え、終了時に外す)
+    restore_profiling = instrument(GameState, profiler, instance=game_state) if profiler else None
+    button_rects = make_button_rects()
+    human_players = tuple(player_num for player_num in (1, 2) if player_num not in ai_players)
+
+    camera = Camera(board_size)
+    frame_renderer = FrameRenderer(icon_images, camera)
+    estimator = WinProbabilityEstimator(win_probability_workers, on_result=lambda: pygame.event.post(
+        pygame.event.Event(WIN_PROBABILITY_EVENT))) if win_probability_workers > 0 else None
+
+    # イベント・アニメーション・AIのいずれかが起きるまで眠り、描画は変化があったときだけ max_fps を上限に行う
+    frame_interval = 1.0 / max_fps
+    last_time, next_frame_time, ai_wait_until = time.monotonic(), 0.0, 0.0
+    events, recorded_game, followed_turn = [], None, None
+    hud_visible, hud_text = profiler is not None, None
+    while True:
+        now = time.monotonic()
+        advance_figure_bonus(game_state, now - last_time); last_time = now
         if game_state.current_phase == "skill_selection":
-            draw_player_panels(screen, game_state, fonts, button_rects)
-            draw_board(screen, game_state, icon_images)
-        elif game_state.winner is not None:
-            draw_player_panels(screen, game_state, fonts, button_rects)
-            draw_board(screen, game_state, icon_images)
-            draw_game_over_screen(screen, game_state, fonts)
+            for player_num in ai_players:
+                if not game_state.selection_confirmed[player_num]: game_state.select_starting_skill(player_num, 'ice_skill')
+        elif game_state.winner is None and game_state.current_turn_player in ai_players and now >= ai_wait_until:
+            with timed(f"ai.{game_state.current_phase}"): run_ai_step(game_state, ai_players[game_state.current_turn_player])
+            ai_wait_until = time.monotonic() + AI_STEP_DELAY
+
+        with timed("loop.events") if events else nullcontext():
+            for event in events:
+                if event.type == pygame.QUIT:
+                    if estimator: estimator.close()
+                    if profiler and profile_path: profiler.dump(profile_path)
+                    if restore_profiling: restore_profiling()
+                    pygame.quit(); sys.exit()
+
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    ai_wait_until = now + AI_STEP_DELAY
+                    action = click_to_action(game_state, event.pos, button_rects, human_players, camera)
+                    if action == ('restart',):
+                        game_state = new_game(seed_rng, board_size, opening_book); frame_renderer.invalidate()
+                        if restore_profiling:
+                            restore_profiling(); restore_profiling = instrument(GameState, profiler, instance=game_state)
+                    elif action == ('undo',): undo_last_action(game_state, ai_players)
+                    elif action: game_state.perform(action, record_undo=True)
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3 and profiler:
+                    hud_visible, hud_text = not hud_visible, None
+                    draw_profile_hud(screen, None, fonts); pygame.display.update(PROFILE_HUD_RECT)
+                handle_camera_event(camera, event, game_state)
+
+        # 手番が替わったら、その手番のプレイヤーが画面外にいるときだけカメラを寄せる
+        if (game_state.current_turn_player, game_state.turn_number) != followed_turn:
+            followed_turn = (game_state.current_turn_player, game_state.turn_number)
+            camera.ensure_visible(game_state.player_pos[game_state.current_turn_player])
+
+        # 棋譜を残せなくても対局の画面は止めない (同じ対局で何度も試さないよう、先に記録済みにする)
+        if record_path and game_state.winner is not None and recorded_game is not game_state:
+            recorded_game = game_state
+            try:
+                write_replays(record_path, [Replay.from_game(game_state)])
+            except (ReplayError, OSError) as error:
+                print(f"棋譜を保存できませんでした: {error}")
+
+        # 推定はワーカーに任せ、ここでは局面の変化を伝えて手元の最新値を読むだけ (待たない)
+        win_probability = None
+        if estimator:
+            estimator.update(game_state); win_probability = estimator.estimate()
+
+        wake_times = []
+        if now >= next_frame_time:
+            frame_start = time.perf_counter()
+            dirty_rects = frame_renderer.render(screen, game_state, fonts, button_rects, win_probability)
+            # HUD は実際に描いたフレームのあとだけ更新する (HUD の描き直しで次のフレームが起きないように)
+            if hud_visible and (dirty_rects or hud_text is None):
+                hud_text = profile_hud_text(profiler)
+                draw_profile_hud(screen, hud_text, fonts); dirty_rects = dirty_rects + [PROFILE_HUD_RECT]
+            if dirty_rects:
+                pygame.display.update(dirty_rects); next_frame_time = now + frame_interval
+                if profiler: profiler.record("loop.render", time.perf_counter() - frame_start)
         else:
-            draw_player_panels(screen, game_state, fonts, button_rects)
-            draw_board(screen, game_state, icon_images)
-
-        pygame.display.flip()
-        clock.tick(60)
+            wake_times.append(next_frame_time)
+        blink_change = next_figure_bonus_change(game_state)
+        if blink_change is not None: wake_times.append(now + blink_change)
+        if game_state.winner is None and game_state.current_turn_player in ai_players: wake_times.append(ai_wait_until)
+        events = wait_for_events(max(0.0, min(wake_times) - time.monotonic()) if wake_times else None)
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ai', type=int, action='append', choices=[1, 2], default=[], help="AIが操作するプレイヤー番号")
+    parser.add_argument('--ai-time', type=float, default=DEFAULT_TIME_BUDGET, help="AIの1手あたりの思考時間 (秒)")
+    parser.add_argument('--fps', type=int, default=DEFAULT_MAX_FPS, help="描画の上限フレームレート")
+    parser.add_argument('--seed', type=int, default=None, help="対局のシードを決める乱数の種")
+    parser.add_argument('--record', default=None, help="決着した対局の棋譜を追記するファイル")
+    parser.add_argument('--replay', default=None, help="棋譜ファイルを再生する")
+    parser.add_argument('--replay-index', type=int, default=0, help="再生する棋譜がファイル内で何局目か")
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE,
+                        help=f"盤の一辺のマス数 ({MIN_BOARD_SIZE}〜{MAX_BOARD_SIZE})")
+    parser.add_argument('--win-probability', type=int, default=0, metavar='WORKERS',
+                        help="パネルに勝率を表示する (ランダムプレイアウトを回すプロセス数)")
+    parser.add_argument('--profile', action='store_true', help="処理時間を計測して画面上部に表示する (F3 で表示切り替え)")
+    parser.add_argument('--profile-out', default=None, help="終了時に計測結果を JSON で書き出すファイル (--profile を含む)")
+    parser.add_argument('--opening-book', default=None, help="初期配置を引く定跡ファイル (fairness.py で作る)")
+    args = parser.parse_args()
+    opening_book = OpeningBook.load(args.opening_book) if args.opening_book else None
+    if opening_book and opening_book.size != args.board_size:
+        parser.error(f"--opening-book is for {opening_book.size}x{opening_book.size} boards; pass --board-size {opening_book.size}")
+    if not MIN_BOARD_SIZE <= args.board_size <= MAX_BOARD_SIZE:
+        parser.error(f"--board-size must be between {MIN_BOARD_SIZE} and {MAX_BOARD_SIZE}")
+    if args.replay:
+        view_replay(next(replay for index, replay in enumerate(iter_replays(args.replay)) if index == args.replay_index))
+    main({player_num: ExpectimaxAI(time_budget=args.ai_time) for player_num in args.ai}, max_fps=args.fps,
+         seed=args.seed, record_path=args.record, win_probability_workers=args.win_probability,
+         board_size=args.board_size, profiler=Profiler() if args.profile or args.profile_out else None,
+         profile_path=args.profile_out, opening_book=opening_book)
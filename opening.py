@@ -0,0 +1,62 @@
+import os
+import struct
+import zlib
+import numpy as np
+from engine import INITIAL_STONES
+
+# --- 定跡ファイルの形式 ---
+# 定跡は fairness.py で解析して作る。GameState(opening_book=...) に渡すと初期配置をここから引く
+# ヘッダ | 定跡 × count
+# ヘッダ: マジック, 版, 盤サイズ, 1定跡あたりの対局数, 定跡数, CRC32
+# 定跡: P1 の泉, P2 の泉, 石 × INITIAL_STONES のセル番号 (各2バイト), 先手, 解析時の P1 勝率 (0〜65535)
+BOOK_MAGIC = b"OPBK"
+BOOK_VERSION = 1
+BOOK_HEADER = struct.Struct("<4sBBHII")
+BOOK_ENTRY = np.dtype([('fountains', '<u2', (2,)), ('stones', '<u2', (INITIAL_STONES,)), ('first_player', 'u1'),
+                       ('p1_win_rate', '<u2')])
+
+class OpeningBookError(Exception):
+    pass
+
+# --- 定跡 ---
+# 引くのは一様な添字1つだけなので、定跡の数によらず O(1)
+class OpeningBook:
+    def __init__(self, size, entries, games=0):
+        self.size, self.games = size, games
+        self.entries = np.asarray(entries, dtype=BOOK_ENTRY)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def opening(self, index):
+        entry = self.entries[index]
+        fountains = tuple(divmod(int(cell), self.size) for cell in entry['fountains'])
+        stones = tuple(divmod(int(cell), self.size) for cell in entry['stones'])
+        return fountains, stones, int(entry['first_player'])
+
+    # GameState._setup_initial_board から呼ばれる ((P1 の泉, P2 の泉), 石の位置, 先手) を返す
+    def draw(self, rng):
+        return self.opening(rng.randrange(len(self.entries)))
+
+    def encode(self):
+        body = self.entries.tobytes()
+        return BOOK_HEADER.pack(BOOK_MAGIC, BOOK_VERSION, self.size, self.games, len(self.entries), zlib.crc32(body)) + body
+
+    @classmethod
+    def decode(cls, data):
+        if len(data) < BOOK_HEADER.size: raise OpeningBookError("not an opening book")
+        magic, version, size, games, count, crc = BOOK_HEADER.unpack_from(data)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION: raise OpeningBookError("not an opening book")
+        body = data[BOOK_HEADER.size:BOOK_HEADER.size + count * BOOK_ENTRY.itemsize]
+        if len(body) != count * BOOK_ENTRY.itemsize or zlib.crc32(body) != crc:
+            raise OpeningBookError("opening book is corrupted")
+        if not count: raise OpeningBookError("opening book is empty")
+        return cls(size, np.frombuffer(body, dtype=BOOK_ENTRY), games)
+
+    def save(self, path):
+        with open(path + ".tmp", 'wb') as f: f.write(self.encode())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f: return cls.decode(f.read())
@@ -0,0 +1,95 @@
+import functools
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# --- 定数定義 ---
+DEFAULT_CAPACITY = 1024
+# instrument() で計測する GameState のメソッド (入れ子で呼ばれるものは呼び出し元の時間にも含まれる)
+PROFILED_METHODS = ('roll_dice', 'find_movable_tiles', 'move_player', 'fall_off_cliff', 'set_placement_type',
+                    'find_placeable_tiles', 'place_object', 'check_figure_bonus', 'use_drill', 'end_turn',
+                    'push_undo', 'undo', 'play_turn', 'perform')
+
+# --- リングバッファ ---
+# 直近 capacity 件の計測値 (秒) だけを保持する。古いものから上書きされ、追加は O(1) で確保も起きない
+class RingBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.values = np.zeros(capacity)
+        self.count = 0
+
+    def append(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    # 保持している値を古い順に返す
+    def recent(self):
+        capacity = len(self.values)
+        if self.count <= capacity: return self.values[:self.count].copy()
+        start = self.count % capacity
+        return np.concatenate((self.values[start:], self.values[:start]))
+
+    def last(self):
+        return self.values[(self.count - 1) % len(self.values)] if self.count else None
+
+# --- 計測 ---
+# 区間名ごとのリングバッファ。区間名は "GameState.roll_dice" や "loop.render" のような文字列
+class Profiler:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buffers = {}
+
+    def record(self, name, seconds):
+        buffer = self.buffers.get(name)
+        if buffer is None: buffer = self.buffers[name] = RingBuffer(self.capacity)
+        buffer.append(seconds)
+
+    @contextmanager
+    def section(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def last(self, name):
+        buffer = self.buffers.get(name)
+        return buffer.last() if buffer else None
+
+    # 区間ごとの統計 (ミリ秒)。count は通算の回数、他はリングバッファに残っている直近の値から求める
+    def summary(self):
+        result = {}
+        for name, buffer in sorted(self.buffers.items()):
+            values = buffer.recent() * 1000.0
+            if not len(values): continue
+            result[name] = {'count': buffer.count, 'window': len(values), 'mean_ms': float(values.mean()),
+                            'p50_ms': float(np.percentile(values, 50)), 'p95_ms': float(np.percentile(values, 95)),
+                            'max_ms': float(values.max())}
+        return result
+
+    def dump(self, path):
+        with open(path, 'w') as f: json.dump({'sections': self.summary()}, f, indent=2, sort_keys=True)
+
+# --- GameState への計測フック ---
+# クラスのメソッドを計測付きのラッパーに差し替える。呼ばない限りフックは存在しないので、通常時の負荷はない
+# 戻り値は元に戻す関数 (対局をまたいで計測したいなら、GameState を作る前に呼んでおく)
+# instance を渡すとその局面への呼び出しだけを記録し、AI の探索用コピーなど他の局面は素通しにする
+# (copy() はインスタンスの属性を写すので、インスタンス側にラッパーを置くとコピーにも付いてしまう)
+def instrument(cls, profiler, methods=PROFILED_METHODS, instance=None):
+    originals = {name: cls.__dict__[name] for name in methods if name in cls.__dict__}
+    for name, method in originals.items():
+        setattr(cls, name, _timed(method, profiler, f"{cls.__name__}.{name}", instance))
+    def restore():
+        for name, method in originals.items(): setattr(cls, name, method)
+    return restore
+
+def _timed(method, profiler, name, instance=None):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        if instance is not None and args[0] is not instance: return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profiler.record(name, time.perf_counter() - start)
+    return wrapper
@@ -0,0 +1,206 @@
+import argparse
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from engine import (GameState, PLACEMENT_TYPES, POSITION_HEADER, REASON_BOMB, REASON_FALL, REASON_BLOCKED,
+                    REASON_NO_PLACE)
+
+# --- 棋譜の形式 ---
+# ヘッダ | ターン記録 × turn_count | 局面スナップショット × snapshot_count
+# ヘッダ: マジック, 版, 盤サイズ, シード, スキル, スナップショット間隔, ターン数, スナップショット数, 勝者, 敗因, CRC32
+# ターン記録: ダイス(2bit)+配置種別(3bit) の1バイトと、移動先・配置先のセル番号 (9×9 なら各1バイトで計3バイト)
+# スナップショット k は turn k*interval の開始時の GameState.pack() で、任意のターンへ O(interval) で移れる
+# 定跡から配置した対局 (スキルの OPENING_FLAG) はシードから初期配置を再現できないので、スナップショット 0 から始める
+REPLAY_MAGIC = b"RPLY"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sBBQBHHHBBI")
+SMALL_TURN = struct.Struct("<3B"); LARGE_TURN = struct.Struct("<B2H")
+DEFAULT_SNAPSHOT_INTERVAL = 16
+# 配置種別コード (0 は配置なし = 移動で負けが確定したターン)。配置先が空なら、その種別を選んで置き場所が無く負けたターン
+TURN_TYPES = (None,) + PLACEMENT_TYPES + ('fall',)
+LOSS_REASONS = (None, REASON_BOMB, REASON_FALL, REASON_BLOCKED, REASON_NO_PLACE)
+OPENING_FLAG = 0x04
+
+class ReplayError(Exception):
+    pass
+
+def _turn_struct(size):
+    return SMALL_TURN if size * size < 0xFF else LARGE_TURN
+
+def _loss_reason_code(win_reason):
+    return next((code for code, reason in enumerate(LOSS_REASONS) if reason and win_reason.endswith(reason)), 0)
+
+def _skill_flags(special_skill):
+    return (special_skill[1] == 'ice_skill') | (special_skill[2] == 'ice_skill') << 1
+
+# --- ターンの適用 ---
+# 記録されたターンを1手ずつ検証しながら進める。不正なら ReplayError
+def apply_turn(state, turn, check_dice=True):
+    dice, dest, p_type, target = turn
+    if state.current_phase != "roll": raise ReplayError("turn recorded after the game ended")
+    if check_dice:
+        state.roll_dice()
+        if state.dice_roll != dice: raise ReplayError(f"dice {dice} does not match the seeded roll {state.dice_roll}")
+    else:
+        state.roll_dice(dice)
+    if state.winner is not None:
+        if dest is not None or p_type is not None: raise ReplayError("turn continues after the player was blocked")
+        return
+    if p_type == 'fall':
+        if not state.fall_trigger_tiles: raise ReplayError("fall recorded without a cliff edge in reach")
+        state.fall_off_cliff(); return
+    if dest not in state.movable_tiles: raise ReplayError(f"illegal move to {dest}")
+    state.move_player(*dest)
+    if state.winner is not None:
+        if p_type is not None: raise ReplayError("turn continues after the game ended")
+        return
+    if p_type is None: raise ReplayError("turn ended without a placement")
+    if p_type != 'stone':
+        state.set_placement_type(p_type)
+        if state.placement_type != p_type: raise ReplayError(f"cannot afford {p_type}")
+    # 配置先の無い記録は、選んだ種別に置き場所が無くて負けたターン
+    if target is None:
+        if state.winner is None: raise ReplayError(f"{p_type} recorded without a target")
+        return
+    if not state.perform(('drill' if p_type == 'drill' else 'place',) + target):
+        raise ReplayError(f"illegal {p_type} target {target}")
+
+# --- 棋譜 ---
+class Replay:
+    def __init__(self, size, seed, special_skill, turns, snapshots=(), snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL,
+                 winner=None, win_reason="", initial_position=None):
+        self.size, self.seed, self.special_skill = size, seed, dict(special_skill)
+        self.initial_position = initial_position
+        self.turns, self.snapshots = list(turns), list(snapshots)
+        self.snapshot_interval, self.winner, self.win_reason = snapshot_interval, winner, win_reason
+
+    # record_turns() で記録した対局から棋譜を作る (スナップショットは記録し直しながら検証も兼ねて撮る)
+    @classmethod
+    def from_game(cls, state, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        if state.seed is None or state.turn_log is None: raise ReplayError("game was not seeded and recorded")
+        replay = cls(state.size, state.seed, state.special_skill, state.turn_log, snapshot_interval=snapshot_interval,
+                     initial_position=state.opening_position)
+        replay.snapshots = replay.verify(take_snapshots=True)
+        replay.winner, replay.win_reason = state.winner, state.win_reason
+        return replay
+
+    def initial_state(self):
+        if self.initial_position is not None:
+            state = GameState.unpack(self.initial_position)
+            state.seed, state.special_skill = self.seed, dict(self.special_skill)
+            return state
+        state = GameState(self.size, seed=self.seed)
+        for player_num in (1, 2): state.select_starting_skill(player_num, self.special_skill[player_num])
+        return state
+
+    # 先頭から全ターンを検証して最終局面を返す (take_snapshots なら撮ったスナップショットの一覧を返す)
+    def verify(self, take_snapshots=False):
+        state, snapshots = self.initial_state(), []
+        for index, turn in enumerate(self.turns):
+            if index % self.snapshot_interval == 0:
+                packed = state.pack()
+                if take_snapshots: snapshots.append(packed)
+                elif index // self.snapshot_interval < len(self.snapshots) and \
+                        self.snapshots[index // self.snapshot_interval] != packed:
+                    raise ReplayError(f"snapshot before turn {index} does not match")
+            apply_turn(state, turn)
+        if take_snapshots: return snapshots
+        if (state.winner, state.win_reason) != (self.winner, self.win_reason): raise ReplayError("result does not match")
+        return state
+
+    # turn 番目のターン開始時の局面 (最寄りのスナップショットから interval 未満のターンだけ進める)
+    def state_at(self, turn):
+        turn = max(0, min(turn, len(self.turns)))
+        if not self.snapshots: raise ReplayError("replay has no snapshots")
+        snapshot = min(turn // self.snapshot_interval, len(self.snapshots) - 1)
+        state = GameState.unpack(self.snapshots[snapshot])
+        state.special_skill = dict(self.special_skill)
+        for index in range(snapshot * self.snapshot_interval, turn): apply_turn(state, self.turns[index], check_dice=False)
+        return state
+
+    def encode(self):
+        turn_struct = _turn_struct(self.size)
+        none_cell = 0xFF if turn_struct is SMALL_TURN else 0xFFFF
+        body = bytearray()
+        for dice, dest, p_type, target in self.turns:
+            body += turn_struct.pack(dice | TURN_TYPES.index(p_type) << 2,
+                                     none_cell if dest is None else dest[0] * self.size + dest[1],
+                                     none_cell if target is None else target[0] * self.size + target[1])
+        for snapshot in self.snapshots: body += snapshot
+        skills = _skill_flags(self.special_skill) | (OPENING_FLAG if self.initial_position is not None else 0)
+        header = REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.size, self.seed, skills,
+                                    self.snapshot_interval, len(self.turns), len(self.snapshots), self.winner or 0,
+                                    _loss_reason_code(self.win_reason), zlib.crc32(body))
+        return header + bytes(body)
+
+    # data の offset から1局分を読み、(棋譜, 次の局の offset) を返す
+    @classmethod
+    def decode(cls, data, offset=0):
+        view = memoryview(data)
+        magic, version, size, seed, skills, interval, turn_count, snapshot_count, winner, reason, crc = \
+            REPLAY_HEADER.unpack_from(view, offset)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION: raise ReplayError("not a replay record")
+        turn_struct = _turn_struct(size)
+        none_cell = 0xFF if turn_struct is SMALL_TURN else 0xFFFF
+        snapshot_size = POSITION_HEADER.size + (size * size + 1) // 2
+        start = offset + REPLAY_HEADER.size
+        turns_end = start + turn_count * turn_struct.size
+        end = turns_end + snapshot_count * snapshot_size
+        if end > len(view) or zlib.crc32(view[start:end]) != crc: raise ReplayError("replay record is corrupted")
+        turns = []
+        for packed_type, dest, target in turn_struct.iter_unpack(view[start:turns_end]):
+            p_type = TURN_TYPES[packed_type >> 2]
+            turns.append((packed_type & 0x03, None if dest == none_cell else divmod(dest, size),
+                          p_type, None if target == none_cell else divmod(target, size)))
+        snapshots = [bytes(view[pos:pos + snapshot_size]) for pos in range(turns_end, end, snapshot_size)]
+        special_skill = {1: 'ice_skill' if skills & 1 else None, 2: 'ice_skill' if skills & 2 else None}
+        if skills & OPENING_FLAG and not snapshots: raise ReplayError("opening replay has no initial snapshot")
+        initial_position = snapshots[0] if skills & OPENING_FLAG else None
+        loser = 1 if winner == 2 else 2
+        win_reason = f"Player {loser} {LOSS_REASONS[reason]}" if winner else ""
+        return cls(size, seed, special_skill, turns, snapshots, interval, winner or None, win_reason, initial_position), end
+
+# --- 棋譜ファイル ---
+# 1ファイルに複数局をそのまま連結して保存する
+def write_replays(path, replays, append=True):
+    with open(path, 'ab' if append else 'wb') as f:
+        for replay in replays: f.write(replay.encode())
+
+def iter_replays(path):
+    with open(path, 'rb') as f: data = f.read()
+    offset = 0
+    while offset < len(data):
+        replay, offset = Replay.decode(data, offset)
+        yield replay
+
+# 全局を検証し (局数, 不正だった局の番号と理由の一覧) を返す
+def verify_file(path):
+    count, failures = 0, []
+    for index, replay in enumerate(iter_replays(path)):
+        count += 1
+        try:
+            replay.verify()
+        except ReplayError as error:
+            failures.append((index, str(error)))
+    return count, failures
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="棋譜ファイルの検証")
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--jobs', type=int, default=1, help="ファイルを並列に検証するプロセス数")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(args.jobs) as pool:
+        results = list(pool.map(verify_file, args.paths)) if args.jobs > 1 else [verify_file(path) for path in args.paths]
+    for path, (count, failures) in zip(args.paths, results):
+        total += count
+        for index, error in failures: print(f"{path}#{index}: {error}")
+        print(f"{path}: {count - len(failures)}/{count} ok")
+    elapsed = time.perf_counter() - start
+    print(f"elapsed: {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} games/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from engine import BOARD_SIZE, GameState, stone_mask_of
+from replay import Replay, ReplayError, write_replays
+from opening import OpeningBook
+
+# --- 同期する項目 ---
+# プレイヤー番号をキーにした辞書は [P1, P2] のリスト、マス座標の並びは [[r, c], ...] として送る
+PLAYER_FIELDS = ('player_pos', 'player_points', 'special_skill', 'selection_confirmed')
+TILE_FIELDS = ('movable_tiles', 'placeable_tiles', 'fall_trigger_tiles', 'drill_target_tiles', 'figure_bonus_tiles')
+SCALAR_FIELDS = ('current_phase', 'current_turn_player', 'dice_roll', 'placement_type', 'winner', 'win_reason')
+# クライアントが選べる初期スキル (None はスキルなし)
+STARTING_SKILLS = ('ice_skill', None)
+
+def encode_fields(state):
+    fields = {name: [getattr(state, name)[1], getattr(state, name)[2]] for name in PLAYER_FIELDS}
+    fields.update({name: [list(pos) for pos in getattr(state, name)] for name in TILE_FIELDS})
+    fields.update({name: getattr(state, name) for name in SCALAR_FIELDS})
+    fields['skill_costs'] = state.skill_costs
+    return fields
+
+# 前回送った内容との差分だけを載せた状態メッセージを作る (synced が None なら全量)
+def state_message(state, synced_fields=None, synced_board=None):
+    fields = encode_fields(state)
+    if synced_fields is None:
+        message = dict(fields, t='state', full=True, board=state.board.ravel().tolist())
+    else:
+        message = {name: value for name, value in fields.items() if synced_fields.get(name) != value}
+        cells = np.argwhere(synced_board != state.board)
+        if len(cells): message['cells'] = [[int(r), int(c), int(state.board[r, c])] for r, c in cells]
+        message['t'] = 'state'
+    return message, fields
+
+def apply_state_message(state, message):
+    if message.get('full'):
+        size = int(len(message['board']) ** 0.5)
+        state.board = np.array(message['board'], dtype=np.int8).reshape(size, size)
+    for r, c, code in message.get('cells', ()):
+        state.board[r, c] = code
+    state.stone_mask = stone_mask_of(state.board)
+    for name in PLAYER_FIELDS:
+        if name in message:
+            value = message[name]
+            setattr(state, name, {1: tuple(value[0]), 2: tuple(value[1])} if name == 'player_pos' else {1: value[0], 2: value[1]})
+    for name in TILE_FIELDS:
+        if name in message: setattr(state, name, [tuple(pos) for pos in message[name]])
+    for name in SCALAR_FIELDS + ('skill_costs',):
+        if name in message: setattr(state, name, message[name])
+
+# --- 対戦 ---
+# 1対戦あたりの保持物は シード付きの GameState・接続2つ・最後に送った内容だけに抑える
+class Match:
+    __slots__ = ('match_id', 'state', 'seats', 'synced_fields', 'synced_board')
+
+    def __init__(self, match_id, seed, opening_book=None):
+        self.match_id, self.state = match_id, GameState(seed=seed, opening_book=opening_book)
+        self.state.record_turns()
+        self.seats = {1: None, 2: None}
+        self.synced_fields, self.synced_board = None, None
+
+    def open_seat(self):
+        return next((seat for seat, writer in self.seats.items() if writer is None), None)
+
+    # 変化があれば差分メッセージを作り、送った内容として覚えておく
+    def take_delta(self):
+        if self.synced_fields is None: return None
+        message, self.synced_fields = state_message(self.state, self.synced_fields, self.synced_board)
+        self.synced_board = self.state.board.copy()
+        # 図形ボーナスの点滅は一度送れば各クライアントが時間で消すので、サーバー側ではすぐ片付ける
+        if self.state.figure_bonus_tiles:
+            self.state.figure_bonus_tiles, self.state.figure_bonus_timer = [], 0.0
+            self.synced_fields['figure_bonus_tiles'] = []
+        return message if len(message) > 1 else None
+
+    def full_state(self):
+        message, self.synced_fields = state_message(self.state)
+        self.synced_board = self.state.board.copy()
+        return message
+
+# --- サーバー ---
+# 1行1JSONのプロトコル。クライアントからは
+#   {"op": "join", "match": 対戦ID (省略可)} / {"op": "act", "action": GameState.perform の操作}
+# サーバーからは joined / state (初回は全量、以降は差分) / error を返す。ダイスはサーバー側で振る
+class MatchServer:
+    def __init__(self, seed=None, record_path=None, opening_book=None):
+        self.matches, self.waiting_match = {}, None
+        self.record_path, self.opening_book = record_path, opening_book
+        # 棋譜の検証と書き込みは重いので、イベントループを止めないよう1本のスレッドで順に行う (追記が混ざらない)
+        self.recorder = ThreadPoolExecutor(1) if record_path else None
+        self.seed_rng = random.Random(seed)
+        self.next_match_id = 1
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.server.close(); await self.server.wait_closed()
+        if self.recorder: self.recorder.shutdown()
+
+    def join(self, match_id, writer):
+        if match_id is None and self.waiting_match is not None and self.waiting_match.open_seat():
+            match = self.waiting_match
+        elif match_id in self.matches:
+            match = self.matches[match_id]
+        else:
+            # クライアントが指定して作った ID とぶつからないよう、使用中の番号は飛ばす
+            if match_id is None:
+                while self.next_match_id in self.matches: self.next_match_id += 1
+                match_id = self.next_match_id; self.next_match_id += 1
+            match = self.matches[match_id] = Match(match_id, self.seed_rng.getrandbits(63), self.opening_book)
+            self.waiting_match = match
+        seat = match.open_seat()
+        if seat is None: return None, None
+        match.seats[seat] = writer
+        if match is self.waiting_match and match.open_seat() is None: self.waiting_match = None
+        return match, seat
+
+    def leave(self, match, seat):
+        match.seats[seat] = None
+        if all(writer is None for writer in match.seats.values()):
+            self.matches.pop(match.match_id, None)
+            if self.waiting_match is match: self.waiting_match = None
+
+    def act(self, match, seat, action):
+        state = match.state
+        if not is_action(action): return "bad action"
+        action = tuple(action)
+        if action[0] == 'skill':
+            if action[-1] not in STARTING_SKILLS: return f"unknown skill {action[-1]}"
+            action = ('skill', seat, action[-1])
+        elif state.current_turn_player != seat or state.current_phase == "skill_selection":
+            return "not your turn"
+        try:
+            applied = state.perform(action)
+        except (IndexError, KeyError, TypeError):
+            applied = False
+        if not applied: return f"illegal action {list(action)}"
+        return None
+
+    # 決着した対局を record_path に棋譜として追記する。失敗しても対局の結果とは別に両者へ知らせるだけにする
+    async def record(self, match):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.recorder, record_game, self.record_path, match.state)
+        except (ReplayError, OSError) as error:
+            data = encode({'t': 'error', 'msg': f"game was not recorded: {error}"})
+            for writer in match.seats.values():
+                if writer is not None: writer.write(data)
+
+    async def handle_client(self, reader, writer):
+        match, seat = None, None
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line: break
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    send(writer, {'t': 'error', 'msg': "bad json"}); continue
+                if not isinstance(message, dict):
+                    send(writer, {'t': 'error', 'msg': "message must be an object"}); continue
+                if message.get('op') == 'join' and match is None:
+                    if not is_match_id(message.get('match')):
+                        send(writer, {'t': 'error', 'msg': "bad match id"}); continue
+                    match, seat = self.join(message.get('match'), writer)
+                    if match is None:
+                        send(writer, {'t': 'error', 'msg': "match is full"}); continue
+                    send(writer, {'t': 'joined', 'match': match.match_id, 'seat': seat})
+                    send(writer, match.full_state())
+                elif message.get('op') == 'act' and match is not None:
+                    error = self.act(match, seat, message.get('action'))
+                    if error:
+                        send(writer, {'t': 'error', 'msg': error}); continue
+                    # 何も変わらなかった操作 (点数不足の設置切り替えなど) には空の差分だけを本人に返す
+                    delta = match.take_delta()
+                    if delta is None:
+                        send(writer, {'t': 'state'}); continue
+                    data = encode(delta)
+                    for other in match.seats.values():
+                        if other is not None: other.write(data)
+                    if match.state.winner is not None and self.record_path: await self.record(match)
+                else:
+                    send(writer, {'t': 'error', 'msg': "unknown op"})
+        except ConnectionError:
+            pass
+        finally:
+            if match is not None: self.leave(match, seat)
+            writer.close()
+
+def record_game(path, state):
+    write_replays(path, [Replay.from_game(state)])
+
+def encode(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b"\n"
+
+# JSON から来た値の形を確かめる (bool は int の一種なので除く。null はスキルなしの選択に使う)
+def is_match_id(value):
+    return value is None or (isinstance(value, int) and not isinstance(value, bool))
+
+def is_action(value):
+    return isinstance(value, list) and bool(value) and \
+        all(item is None or (isinstance(item, (str, int)) and not isinstance(item, bool)) for item in value)
+
+def send(writer, message):
+    writer.write(encode(message))
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="ヘッドレス対戦サーバー")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--record', default=None, help="決着した対局の棋譜を追記するファイル")
+    parser.add_argument('--opening-book', default=None, help="初期配置を引く定跡ファイル (fairness.py で作る)")
+    args = parser.parse_args()
+    opening_book = OpeningBook.load(args.opening_book) if args.opening_book else None
+    if opening_book and opening_book.size != BOARD_SIZE: parser.error(f"--opening-book must be for {BOARD_SIZE}x{BOARD_SIZE} boards")
+
+    async def serve():
+        server = MatchServer(seed=args.seed, record_path=args.record, opening_book=opening_book)
+        port = await server.start(args.host, args.port)
+        print(f"listening on {args.host}:{port}")
+        await server.server.serve_forever()
+    asyncio.run(serve())
+
+if __name__ == '__main__':
+    main()
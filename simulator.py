@@ -0,0 +1,253 @@
+import argparse
+import time
+import numpy as np
+from engine import (BOARD_SIZE, BITMASK_MAX_SIZE, DEFAULT_SKILL_COSTS, RECOVERY_POINTS, TURN_POINTS, FIGURE_BONUS_POINTS,
+                    get_shape_index, DIRECTIONS, EMPTY_CELL, STONE_CELL, RECOVERY_CELL, BOMB_CELL, ICE_CELL, REASON_BOMB, REASON_FALL,
+                    REASON_BLOCKED, REASON_NO_PLACE, FOUNTAIN_MIN_DISTANCE, INITIAL_STONES, fountain_region, stone_banned_cells)
+
+# --- 定数定義 ---
+# 敗因コード (0 は未決着)
+WIN_REASONS = ("", REASON_BOMB, REASON_FALL, REASON_BLOCKED, REASON_NO_PLACE)
+BOMB_LOSS = 1; FALL_LOSS = 2; BLOCKED_LOSS = 3; NO_PLACE_LOSS = 4
+# スキル番号 (skill_uses の並び)
+SKILL_TYPES = ('recovery', 'bomb', 'drill', 'ice')
+SKILL_CELLS = np.array([RECOVERY_CELL, BOMB_CELL, EMPTY_CELL, ICE_CELL], dtype=np.int8)
+DIRECTION_ARRAY = np.array(DIRECTIONS, dtype=np.int16)
+MOVE_NONE = 0; MOVE_STEP = 1; MOVE_FALL = 2
+
+# --- バッチシミュレータ ---
+# N局を (N, size, size) の int8 盤面でまとめて保持し、step() 1回で全局を1ターンずつ進める
+# 方策は「動ける所へランダムに移動し、skill_rate の確率で払えるスキルを使い、それ以外は石を置く」
+class BatchSimulator:
+    def __init__(self, n_games, size=BOARD_SIZE, seed=None, skill_costs=None, recovery_points=RECOVERY_POINTS,
+                 turn_points=TURN_POINTS, figure_bonus_points=FIGURE_BONUS_POINTS, skill_rate=0.3, ice_skill=(True, True)):
+        self.n_games, self.size = n_games, size
+        self.rng = np.random.default_rng(seed)
+        costs = dict(DEFAULT_SKILL_COSTS, **(skill_costs or {}))
+        self.skill_costs = np.array([costs[t] for t in SKILL_TYPES], dtype=np.int32)
+        self.recovery_points, self.turn_points, self.figure_bonus_points = recovery_points, turn_points, figure_bonus_points
+        self.skill_rate = skill_rate
+        self.ice_skill = np.array(ice_skill, dtype=bool)
+        self._build_shape_table()
+        self.reset()
+
+    def _build_shape_table(self):
+        size, index = self.size, get_shape_index(self.size)
+        if index.local: raise ValueError(f"BatchSimulator supports boards up to {BITMASK_MAX_SIZE}x{BITMASK_MAX_SIZE}")
+        # 盤外に番兵セルを2つ置く: size*size は常に空き (ダミー配置用)、size*size+1 は常に石 (短い図形の埋め草)
+        empty_pad, stone_pad = size * size, size * size + 1
+        placement_ids = {mask: p_idx for p_idx, (mask, _) in enumerate(index.placements)}
+        length = max(len(coords) for _, coords in index.placements)
+        self.shape_cells = np.full((len(index.placements) + 1, length), stone_pad, dtype=np.int32)
+        for p_idx, (_, coords) in enumerate(index.placements):
+            self.shape_cells[p_idx, :len(coords)] = [r * size + c for r, c in coords]
+        self.shape_cells[-1] = empty_pad
+        width = max(len(p) for p in index.cell_placements)
+        self.cell_shapes = np.full((size * size, width), len(index.placements), dtype=np.int32)
+        for cell, p_list in enumerate(index.cell_placements):
+            self.cell_shapes[cell, :len(p_list)] = [placement_ids[mask] for mask, _ in p_list]
+
+    def reset(self):
+        n, size = self.n_games, self.size
+        self.boards = np.full((n, size, size), EMPTY_CELL, dtype=np.int8)
+        self.player_pos = np.empty((n, 2, 2), dtype=np.int16)
+        self.player_pos[:, 0] = (size // 2, 0); self.player_pos[:, 1] = (size // 2, size - 1)
+        self.player_points = np.zeros((n, 2), dtype=np.int32)
+        self.turn = np.zeros(n, dtype=np.int8)
+        self.dice_roll = np.zeros(n, dtype=np.int8)
+        self.winner = np.zeros(n, dtype=np.int8)
+        self.win_reason = np.zeros(n, dtype=np.int8)
+        self.turn_count = np.zeros(n, dtype=np.int32)
+        self.skill_uses = np.zeros(len(SKILL_TYPES), dtype=np.int64)
+        self.figure_bonuses = 0
+        self._setup_initial_boards()
+
+    # 配置の規則は engine の fountain_region・stone_banned_cells などから作り、GameState・定跡の解析と揃える
+    def _setup_initial_boards(self):
+        n, size, rng = self.n_games, self.size, self.rng
+        rows, cols = np.divmod(np.arange(size * size), size)
+        flat = self.boards.reshape(n, -1)
+        p1_pos, p2_pos = self.player_pos[0, 0], self.player_pos[0, 1]
+        dist_p1 = np.abs(rows - p1_pos[0]) + np.abs(cols - p1_pos[1])
+        dist_p2 = np.abs(rows - p2_pos[0]) + np.abs(cols - p2_pos[1])
+        p1_spots = np.flatnonzero(self._region_mask(1) & (dist_p1 >= FOUNTAIN_MIN_DISTANCE))
+        p2_spots = np.flatnonzero(self._region_mask(2) & (dist_p2 >= FOUNTAIN_MIN_DISTANCE))
+        p1_fountain = p1_spots[rng.integers(len(p1_spots), size=n)]
+        p2_fountain = p2_spots[rng.integers(len(p2_spots), size=n)]
+        game_idx = np.arange(n)
+        flat[game_idx, p1_fountain] = RECOVERY_CELL; flat[game_idx, p2_fountain] = RECOVERY_CELL
+        dist1, dist2 = dist_p1[p1_fountain], dist_p2[p2_fountain]
+        self.turn[:] = np.where(dist1 > dist2, 0, np.where(dist2 > dist1, 1, rng.integers(2, size=n)))
+        self.first_player = self.turn + 1
+        self.player_points[:] = 0
+        # 石はプレイヤーまわりの禁止マス (局ごとの泉は下で別に除く) を避けて重複なしで選ぶ
+        banned = [r * size + c for r, c in stone_banned_cells({1: tuple(p1_pos), 2: tuple(p2_pos)}, ())
+                  if 0 <= r < size and 0 <= c < size]
+        keys = rng.random((n, size * size)); keys[:, banned] = 2.0
+        keys[game_idx, p1_fountain] = 2.0; keys[game_idx, p2_fountain] = 2.0
+        stones = np.argpartition(keys, INITIAL_STONES, axis=1)[:, :INITIAL_STONES]
+        flat[game_idx[:, None], stones] = STONE_CELL
+
+    def _region_mask(self, player_num):
+        rows, cols = np.divmod(np.arange(self.size * self.size), self.size)
+        (r0, r1), (c0, c1) = fountain_region(self.size, player_num)
+        return (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+
+    def _game_over(self, games, loser_idx, reason):
+        self.winner[games] = 2 - loser_idx; self.win_reason[games] = reason
+
+    def find_moves(self, games):
+        size = self.size
+        boards, turn = self.boards[games], self.turn[games]
+        me = self.player_pos[games, turn].astype(np.int16)
+        other = self.player_pos[games, 1 - turn]
+        n = len(games)
+        cur = np.repeat(me[:, None, :], 4, axis=1)
+        steps_left = np.repeat(self.dice_roll[games, None].astype(np.int16), 4, axis=1)
+        status = np.zeros((n, 4), dtype=np.int8)
+        has_dest = np.zeros((n, 4), dtype=bool)
+        open_ray = np.ones((n, 4), dtype=bool)
+        row_idx = np.repeat(np.arange(n)[:, None], 4, axis=1)
+        for _ in range(size + 3):
+            if not open_ray.any(): break
+            nxt = cur + DIRECTION_ARRAY
+            inside = (nxt[..., 0] >= 0) & (nxt[..., 0] < size) & (nxt[..., 1] >= 0) & (nxt[..., 1] < size)
+            fall = open_ray & ~inside
+            status[fall & has_dest] = MOVE_FALL
+            open_ray &= inside
+            cell = boards[row_idx, np.clip(nxt[..., 0], 0, size - 1), np.clip(nxt[..., 1], 0, size - 1)]
+            hits_other = (nxt[..., 0] == other[:, None, 0]) & (nxt[..., 1] == other[:, None, 1])
+            stop = open_ray & ((cell == STONE_CELL) | hits_other)
+            status[stop & has_dest] = MOVE_STEP
+            open_ray &= ~stop
+            # 氷は直線上で二度踏まれないので、踏むたびに1歩延長する
+            cur = np.where(open_ray[..., None], nxt, cur)
+            has_dest |= open_ray
+            steps_left -= open_ray & (cell != ICE_CELL)
+            arrived = open_ray & (steps_left == 0)
+            status[arrived] = MOVE_STEP
+            open_ray &= ~arrived
+        return cur, status
+
+    def step(self):
+        rng, size = self.rng, self.size
+        games = np.flatnonzero(self.winner == 0)
+        if len(games) == 0: return 0
+        n = len(games)
+        self.dice_roll[games] = rng.integers(1, 4, size=n)
+        dest, status = self.find_moves(games)
+        turn = self.turn[games]
+
+        # 移動先の選択: 動けるマスがあればその中からランダム、無ければ落下、どちらも無ければ行き詰まり
+        can_move = status == MOVE_STEP
+        blocked = ~(status != MOVE_NONE).any(axis=1)
+        falls = ~can_move.any(axis=1) & ~blocked
+        self._game_over(games[blocked], turn[blocked], BLOCKED_LOSS)
+        self._game_over(games[falls], turn[falls], FALL_LOSS)
+        keys = np.where(can_move, rng.random((n, 4)), -1.0)
+        choice = keys.argmax(axis=1)
+        alive = can_move.any(axis=1)
+        games, turn, dest = games[alive], turn[alive], dest[alive, choice[alive]]
+
+        flat = self.boards.reshape(self.n_games, -1)
+        dest_cell = dest[:, 0] * size + dest[:, 1]
+        dest_type = flat[games, dest_cell]
+        bombed = dest_type == BOMB_CELL
+        self._game_over(games[bombed], turn[bombed], BOMB_LOSS)
+        games, turn, dest, dest_cell, dest_type = games[~bombed], turn[~bombed], dest[~bombed], dest_cell[~bombed], dest_type[~bombed]
+        self.player_pos[games, turn] = dest
+        self.player_points[games, turn] += np.where(dest_type == RECOVERY_CELL, self.recovery_points, 0).astype(np.int32)
+
+        # 配置フェーズ: 上下左右の隣接マス
+        n = len(games)
+        around = dest[:, None, :] + DIRECTION_ARRAY
+        inside = (around[..., 0] >= 0) & (around[..., 0] < size) & (around[..., 1] >= 0) & (around[..., 1] < size)
+        around_cell = np.clip(around[..., 0], 0, size - 1) * size + np.clip(around[..., 1], 0, size - 1)
+        around_type = flat[games[:, None], around_cell]
+        other = self.player_pos[games, 1 - turn]
+        free = inside & ~((around[..., 0] == other[:, None, 0]) & (around[..., 1] == other[:, None, 1]))
+        stone_ok = free & (around_type != STONE_CELL)
+        empty_ok = free & (around_type == EMPTY_CELL)
+        drill_ok = inside & (around_type == STONE_CELL)
+        no_place = ~stone_ok.any(axis=1)
+        self._game_over(games[no_place], turn[no_place], NO_PLACE_LOSS)
+        keep = ~no_place
+        games, turn, stone_ok, empty_ok, drill_ok, around_cell = \
+            games[keep], turn[keep], stone_ok[keep], empty_ok[keep], drill_ok[keep], around_cell[keep]
+        n = len(games)
+
+        points = self.player_points[games, turn]
+        has_empty, has_stone = empty_ok.any(axis=1), drill_ok.any(axis=1)
+        available = (points[:, None] >= self.skill_costs) & np.stack(
+            [has_empty, has_empty, has_stone, has_empty & self.ice_skill[turn]], axis=1)
+        use_skill = available.any(axis=1) & (rng.random(n) < self.skill_rate)
+        skill = np.where(available, rng.random((n, len(SKILL_TYPES))), -1.0).argmax(axis=1)
+        skill = np.where(use_skill, skill, -1)
+        targets = np.where((skill == 2)[:, None], drill_ok, np.where((skill >= 0)[:, None], empty_ok, stone_ok))
+        target = np.where(targets, rng.random((n, 4)), -1.0).argmax(axis=1)
+        target_cell = around_cell[np.arange(n), target]
+
+        skilled = skill >= 0
+        self.player_points[games[skilled], turn[skilled]] -= self.skill_costs[skill[skilled]]
+        flat[games[skilled], target_cell[skilled]] = SKILL_CELLS[skill[skilled]]
+        self.skill_uses += np.bincount(skill[skilled], minlength=len(SKILL_TYPES))
+        stoned = ~skilled
+        flat[games[stoned], target_cell[stoned]] = STONE_CELL
+        bonus = self.count_figure_bonus(games[stoned], target_cell[stoned])
+        self.player_points[games[stoned], turn[stoned]] += bonus * self.figure_bonus_points
+        self.figure_bonuses += int(bonus.sum())
+
+        # ターン終了
+        next_turn = 1 - turn
+        self.turn[games] = next_turn
+        self.player_points[games, next_turn] += self.turn_points
+        self.dice_roll[games] = 0
+        self.turn_count[games] += 1
+        return len(games)
+
+    def count_figure_bonus(self, games, cells):
+        pads = np.broadcast_to(np.array([EMPTY_CELL, STONE_CELL], dtype=np.int8), (len(games), 2))
+        padded = np.concatenate([self.boards.reshape(self.n_games, -1)[games], pads], axis=1)
+        shape_cells = self.shape_cells[self.cell_shapes[cells]]
+        complete = (padded[np.arange(len(games))[:, None, None], shape_cells] == STONE_CELL).all(axis=2)
+        return complete.sum(axis=1).astype(np.int32)
+
+    def run(self, max_turns=1000):
+        for _ in range(max_turns):
+            if not self.step(): break
+        return self
+
+    def summary(self):
+        done = self.winner > 0
+        finished = max(int(done.sum()), 1)
+        return {
+            'games': self.n_games, 'finished': int(done.sum()),
+            'win_rate': {p: float((self.winner == p).sum()) / finished for p in (1, 2)},
+            'first_player_win_rate': float((self.winner[done] == self.first_player[done]).sum()) / finished,
+            'win_reason': {WIN_REASONS[code]: int((self.win_reason == code).sum()) for code in range(1, len(WIN_REASONS))},
+            'mean_turns': float(self.turn_count[done].mean()) if done.any() else 0.0,
+            'skill_uses': dict(zip(SKILL_TYPES, self.skill_uses.tolist())),
+            'figure_bonuses': self.figure_bonuses,
+        }
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="ヘッドレスのバッチ自己対戦シミュレーション")
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--skill-rate', type=float, default=0.3)
+    for skill_type in SKILL_TYPES:
+        parser.add_argument(f'--{skill_type}-cost', type=int, default=DEFAULT_SKILL_COSTS[skill_type])
+    parser.add_argument('--recovery-points', type=int, default=RECOVERY_POINTS)
+    parser.add_argument('--turn-points', type=int, default=TURN_POINTS)
+    args = parser.parse_args()
+    costs = {t: getattr(args, f'{t}_cost') for t in SKILL_TYPES}
+    start = time.perf_counter()
+    sim = BatchSimulator(args.games, seed=args.seed, skill_costs=costs, skill_rate=args.skill_rate,
+                         recovery_points=args.recovery_points, turn_points=args.turn_points).run()
+    elapsed = time.perf_counter() - start
+    for key, value in sim.summary().items(): print(f"{key}: {value}")
+    print(f"elapsed: {elapsed:.2f}s ({args.games / elapsed:.0f} games/s)")
+
+if __name__ == '__main__':
+    main()
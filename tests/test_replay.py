@@ -0,0 +1,32 @@
+import random
+from engine import GameState, REASON_NO_PLACE
+from replay import Replay
+
+# 回復を選んだら置き場所が無くてその場で負ける局面まで、perform() だけで進める (シード 380 でそうなる)
+def _play_until_no_place(seed=380):
+    rng, state = random.Random(seed), GameState(seed=seed)
+    state.record_turns()
+    for player_num in (1, 2): state.perform(('skill', player_num, 'ice_skill'))
+    while state.winner is None:
+        state.perform(('roll',))
+        if state.winner is not None: break
+        state.perform(('move',) + rng.choice(state.movable_tiles + state.fall_trigger_tiles))
+        if state.winner is not None: break
+        player = state.current_turn_player
+        if not state._placement_targets(state.player_pos[player], 'recovery') and \
+                state.player_points[player] >= state.skill_costs['recovery']:
+            state.perform(('placement', 'recovery'))
+            if state.winner is not None: break
+        if rng.random() < 0.6 and state.player_points[player] >= state.skill_costs['ice']: state.perform(('placement', 'ice'))
+        state.perform(('place',) + rng.choice(state.placeable_tiles))
+    return state
+
+def test_no_place_loss_after_choosing_a_skill_round_trips():
+    state = _play_until_no_place()
+    assert state.win_reason.endswith(REASON_NO_PLACE)
+    assert state.turn_log[-1][2:] == ('recovery', None)
+    replay = Replay.decode(Replay.from_game(state).encode())[0]
+    assert replay.turns[-1] == state.turn_log[-1]
+    final = replay.verify()
+    assert (final.winner, final.win_reason) == (state.winner, state.win_reason)
+    assert replay.state_at(len(replay.turns)).win_reason == state.win_reason
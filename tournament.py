@@ -0,0 +1,173 @@
+import argparse
+import importlib
+import importlib.util
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+import numpy as np
+from ai import RandomAI, GreedyAI, ExpectimaxAI, DEFAULT_TIME_BUDGET
+from engine import BOARD_SIZE, GameState, DEFAULT_SKILL_COSTS, RECOVERY_CELL, REASON_BOMB, REASON_FALL, REASON_BLOCKED, REASON_NO_PLACE
+from replay import Replay
+from opening import OpeningBook
+
+# --- 定数定義 ---
+SKILL_TYPES = ('recovery', 'bomb', 'drill', 'ice')
+LOSS_REASONS = {REASON_BOMB: 'bomb', REASON_FALL: 'fall', REASON_BLOCKED: 'blocked', REASON_NO_PLACE: 'no_place'}
+DEFAULT_CHUNK_SIZE = 200
+MAX_TURNS = 1000
+FIRST_PLAYER_RULES = ('distance', 'coin', 'book')
+
+# --- 席の方策 ---
+# "random" / "greedy" / "expectimax[:思考時間]" / "script:モジュールまたは.pyファイル:名前"
+# script の名前は choose_turn(state) を持つクラスか、state を受け取ってターンを返す関数
+class ScriptedAI:
+    def __init__(self, choose_turn):
+        self.choose_turn = choose_turn
+
+def make_policy(spec, seed=None):
+    kind, _, arg = spec.partition(':')
+    if kind == 'random': return RandomAI(seed)
+    if kind == 'greedy': return GreedyAI()
+    if kind == 'expectimax': return ExpectimaxAI(time_budget=float(arg) if arg else DEFAULT_TIME_BUDGET)
+    if kind == 'script':
+        location, _, name = arg.rpartition(':')
+        if location.endswith('.py'):
+            module_spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(location))[0], location)
+            module = importlib.util.module_from_spec(module_spec); module_spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(location)
+        target = getattr(module, name)
+        return target() if isinstance(target, type) else ScriptedAI(target)
+    raise ValueError(f"unknown seat policy: {spec}")
+
+# --- 1局の実行 ---
+# 初期配置で先手が泉までの距離で決まったか ('distance')、同距離のコイントスか ('coin')、定跡で決まったか ('book')
+def first_player_rule(state):
+    if state.opening_book is not None: return 'book'
+    half = state.size // 2
+    fountains = [tuple(pos) for pos in np.argwhere(state.board == RECOVERY_CELL)]
+    dist = {p: min(abs(r - state.player_pos[p][0]) + abs(c - state.player_pos[p][1])
+                   for r, c in fountains if (c < half) == (p == 1)) for p in (1, 2)}
+    return 'coin' if dist[1] == dist[2] else 'distance'
+
+def play_game(policies, seed, skill_costs, ice_skill, record=False, opening_book=None):
+    state = GameState(opening_book.size if opening_book else BOARD_SIZE, seed=seed, opening_book=opening_book)
+    state.skill_costs = dict(skill_costs)
+    if record: state.record_turns()
+    for player_num in (1, 2): state.select_starting_skill(player_num, 'ice_skill' if ice_skill[player_num - 1] else None)
+    first_player, rule = state.current_turn_player, first_player_rule(state)
+    skill_uses = Counter()
+    for _ in range(MAX_TURNS):
+        state.roll_dice()
+        if state.winner is not None: break
+        turn = policies[state.current_turn_player].choose_turn(state)
+        if turn[1] in SKILL_TYPES: skill_uses[state.current_turn_player, turn[1]] += 1
+        state.play_turn(turn)
+        if state.winner is not None: break
+    return state, first_player, rule, skill_uses
+
+# --- ワーカープロセス ---
+# 席の方策はプロセスごとに1度だけ作り、結果はチャンク単位の集計 (Counter) だけを親へ返す
+_worker = {}
+
+def _init_worker(seat_specs, skill_costs, ice_skill, record, opening_book_path=None):
+    _worker.update(seat_specs=seat_specs, skill_costs=skill_costs, ice_skill=ice_skill, record=record,
+                   policies={spec: make_policy(spec) for spec in set(seat_specs)},
+                   opening_book=OpeningBook.load(opening_book_path) if opening_book_path else None)
+
+def play_chunk(chunk):
+    base_seed, start, count, alternate = chunk
+    seat_specs, policies = _worker['seat_specs'], _worker['policies']
+    stats, replays = Counter(), []
+    for index in range(start, start + count):
+        # alternate なら奇数番目の局で席を入れ替え、同じ方策が先後両方を持つようにする
+        seats = seat_specs[::-1] if alternate and index % 2 else seat_specs
+        seed = (base_seed * 1000003 + index) & 0x7FFFFFFFFFFFFFFF
+        # ランダム席は局ごとに種を振り直し、同じ --seed なら結果が再現するようにする
+        for seat_index, spec in enumerate(seats):
+            if isinstance(policies[spec], RandomAI): policies[spec].rng.seed(seed + seat_index)
+        state, first_player, rule, skill_uses = play_game({1: policies[seats[0]], 2: policies[seats[1]]}, seed,
+                                                          _worker['skill_costs'], _worker['ice_skill'], _worker['record'],
+                                                          _worker['opening_book'])
+        stats['games'] += 1
+        stats['turns'] += state.turn_number
+        stats['first_player_games', rule] += 1
+        for (player_num, p_type), uses in skill_uses.items():
+            stats['skill', p_type] += uses; stats['skill_by_policy', seats[player_num - 1], p_type] += uses
+        if state.winner is None: continue
+        stats['finished'] += 1
+        stats['win_player', state.winner] += 1
+        stats['win_policy', seats[state.winner - 1]] += 1
+        stats['games_policy', seats[0]] += 1; stats['games_policy', seats[1]] += 1
+        stats['win_reason', next(name for reason, name in LOSS_REASONS.items() if state.win_reason.endswith(reason))] += 1
+        if state.winner == first_player: stats['first_player_wins', rule] += 1
+        if _worker['record']: replays.append(Replay.from_game(state).encode())
+    return stats, b"".join(replays)
+
+# --- 集計 ---
+def summarize(stats, seat_specs):
+    finished = max(stats['finished'], 1)
+    policies = sorted(set(seat_specs))
+    return {
+        'games': stats['games'], 'finished': stats['finished'],
+        'win_rate': {p: stats['win_player', p] / finished for p in (1, 2)},
+        'policy_win_rate': {spec: stats['win_policy', spec] / max(stats['games_policy', spec], 1) for spec in policies},
+        'win_reason': {name: stats['win_reason', name] / finished for name in LOSS_REASONS.values()},
+        'first_player_win_rate': {rule: stats['first_player_wins', rule] / max(stats['first_player_games', rule], 1)
+                                  for rule in FIRST_PLAYER_RULES},
+        'first_player_rule': {rule: stats['first_player_games', rule] for rule in FIRST_PLAYER_RULES},
+        'mean_turns': stats['turns'] / max(stats['games'], 1),
+        'skill_uses_per_game': {p_type: stats['skill', p_type] / max(stats['games'], 1) for p_type in SKILL_TYPES},
+        'skill_uses_by_policy': {spec: {p_type: stats['skill_by_policy', spec, p_type] for p_type in SKILL_TYPES}
+                                 for spec in policies},
+    }
+
+# games 局をチャンクに分けてプロセスプールで回し、終わった順に集計へ足し込む
+def run_tournament(seat_specs, games, skill_costs=None, ice_skill=(True, True), seed=None, jobs=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, alternate=True, record_path=None, progress=None, opening_book_path=None):
+    base_seed = seed if seed is not None else random.getrandbits(40)
+    costs = dict(DEFAULT_SKILL_COSTS, **(skill_costs or {}))
+    chunks = [(base_seed, start, min(chunk_size, games - start), alternate) for start in range(0, games, chunk_size)]
+    stats = Counter()
+    with Pool(jobs or os.cpu_count(), initializer=_init_worker,
+              initargs=(tuple(seat_specs), costs, tuple(ice_skill), record_path is not None, opening_book_path)) as pool:
+        for chunk_stats, replays in pool.imap_unordered(play_chunk, chunks):
+            stats.update(chunk_stats)
+            if replays:
+                with open(record_path, 'ab') as f: f.write(replays)
+            if progress: progress(stats)
+    return summarize(stats, seat_specs)
+
+# --- コマンドライン ---
+def main():
+    parser = argparse.ArgumentParser(description="GameState による並列自己対戦大会")
+    parser.add_argument('--seat1', default='random', help="P1 の方策 (random / greedy / expectimax[:秒] / script:場所:名前)")
+    parser.add_argument('--seat2', default='random', help="P2 の方策")
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--jobs', type=int, default=None, help="ワーカープロセス数 (既定は全コア)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--no-alternate', action='store_true', help="席を入れ替えずに常に seat1 を P1 にする")
+    parser.add_argument('--no-ice', type=int, action='append', choices=[1, 2], default=[], help="氷スキルを持たないプレイヤー番号")
+    for skill_type in SKILL_TYPES:
+        parser.add_argument(f'--{skill_type}-cost', type=int, default=DEFAULT_SKILL_COSTS[skill_type])
+    parser.add_argument('--record', default=None, help="決着した対局の棋譜を追記するファイル")
+    parser.add_argument('--opening-book', default=None, help="初期配置を引く定跡ファイル (fairness.py で作る)")
+    args = parser.parse_args()
+    costs = {t: getattr(args, f'{t}_cost') for t in SKILL_TYPES}
+    start = time.perf_counter()
+    def progress(stats):
+        print(f"\r{stats['games']}/{args.games} games", end="", flush=True)
+    result = run_tournament((args.seat1, args.seat2), args.games, skill_costs=costs,
+                            ice_skill=(1 not in args.no_ice, 2 not in args.no_ice), seed=args.seed, jobs=args.jobs,
+                            chunk_size=args.chunk_size, alternate=not args.no_alternate, record_path=args.record,
+                            progress=progress, opening_book_path=args.opening_book)
+    elapsed = time.perf_counter() - start
+    print()
+    for key, value in result.items(): print(f"{key}: {value}")
+    print(f"elapsed: {elapsed:.2f}s ({args.games / elapsed:.0f} games/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from ai import search_turns
+from engine import GameState
+
+# --- 定数定義 ---
+ROLLOUT_BATCH = 32
+DEFAULT_MAX_ROLLOUTS = 2048
+ROLLOUT_MAX_TURNS = 200
+DEFAULT_CACHE_SIZE = 4096
+
+# --- ランダムプレイアウト ---
+# 途中のフェーズ (移動待ち・配置待ち) からでも始められるよう、手番の残りを先に終わらせてから1ターンずつ進める
+def _finish_turn(state, rng):
+    if state.current_phase == 'move':
+        state.play_turn(rng.choice(search_turns(state)))
+    elif state.current_phase in ('place', 'drill_target'):
+        state.set_placement_type('stone')
+        if state.winner is None: state.place_object(*rng.choice(state.placeable_tiles))
+
+# --- ワーカープロセス ---
+# ProcessPoolExecutor は投げたバッチを先読みして実行中扱いにするため、future.cancel() では古いバッチを止められない
+# そこで局面が変わるたびに親が世代番号を進め、ワーカーは1回のプレイアウトごとにそれを見て古いバッチを打ち切る
+_worker = {}
+
+def _init_worker(generation):
+    _worker['generation'] = generation
+
+# 打ち切ったときは実際に終えた回数を返す
+def rollout_wins(packed, count, seed, generation=None):
+    rng, p1_wins, shared = random.Random(seed), 0.0, _worker.get('generation')
+    for done in range(count):
+        if shared is not None and generation is not None and shared.value != generation: return p1_wins, done
+        state = GameState.unpack(packed)
+        _finish_turn(state, rng)
+        for _ in range(ROLLOUT_MAX_TURNS):
+            if state.winner is not None: break
+            state.roll_dice(rng.randint(1, 3))
+            if state.winner is None: state.play_turn(rng.choice(search_turns(state)))
+        p1_wins += 1.0 if state.winner == 1 else 0.5 if state.winner is None else 0.0
+    return p1_wins, count
+
+# --- 勝率推定 ---
+# 局面 (GameState.pack() のバイト列) ごとに P1 の勝ち数と試行数を貯め、ワーカープロセスへ小分けのバッチを投げ続ける
+# update() は待たずに戻る。局面が変わった (移動・配置・ドリルでフェーズが進んだ) ら古い局面のバッチは取り消し、実行中のものも打ち切らせる
+class WinProbabilityEstimator:
+    def __init__(self, workers=2, max_rollouts=DEFAULT_MAX_ROLLOUTS, on_result=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.generation = multiprocessing.Value('q', 0, lock=False)
+        self.pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(self.generation,))
+        self.workers, self.max_rollouts, self.on_result, self.cache_size = workers, max_rollouts, on_result, cache_size
+        self.results, self.pending, self.key = {}, [], None
+        self.seed_rng = random.Random()
+
+    def update(self, game_state):
+        key = game_state.pack() if game_state.winner is None and game_state.current_phase != "skill_selection" else None
+        if key != self.key:
+            for future in self.pending: future.cancel()
+            self.generation.value += 1
+            self.key = key
+        self.pending = [future for future in self.pending if not future.done()]
+        if key is None: return
+        wins, total = self.results.get(key, (0.0, 0))
+        while len(self.pending) < self.workers and total + len(self.pending) * ROLLOUT_BATCH < self.max_rollouts:
+            future = self.pool.submit(rollout_wins, key, ROLLOUT_BATCH, self.seed_rng.getrandbits(64),
+                                      self.generation.value)
+            future.add_done_callback(lambda done, key=key: self._collect(key, done))
+            self.pending.append(future)
+
+    # ワーカーの結果はプール側のスレッドで届くので、辞書への加算だけ行い、描画側へは on_result で知らせる
+    def _collect(self, key, future):
+        if future.cancelled() or future.exception() is not None: return
+        wins, count = future.result()
+        if not count: return
+        if key not in self.results and len(self.results) >= self.cache_size: del self.results[next(iter(self.results))]
+        old_wins, old_total = self.results.get(key, (0.0, 0))
+        self.results[key] = (old_wins + wins, old_total + count)
+        if self.on_result: self.on_result()
+
+    # P1 から見た (勝率, 試行数)。まだ1バッチも終わっていなければ None
+    def estimate(self):
+        entry = self.results.get(self.key) if self.key is not None else None
+        if not entry or not entry[1]: return None
+        return entry[0] / entry[1], entry[1]
+
+    def close(self):
+        self.on_result = None
+        self.generation.value += 1
+        for future in self.pending: future.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)